@@ -0,0 +1,168 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .stats import WorkerStats
+from ppcls.utils import logger
+
+__all__ = [
+    'BadSampleHandler', 'check_samples', 'load_blacklist', 'save_blacklist'
+]
+
+
+def load_blacklist(path):
+    """
+    Load a blacklist file, every line is "raw_index<TAB>description"
+
+    Returns:
+        entries(list): list of (raw_index, description)
+    """
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line:
+                raw_idx, desc = line.split('\t', 1)
+                entries.append((int(raw_idx), desc))
+    return entries
+
+
+def save_blacklist(path, entries):
+    with open(path, 'w') as f:
+        for raw_idx, desc in entries:
+            f.write("{}\t{}\n".format(raw_idx, desc))
+
+
+def check_samples(dataset, num_threads=16):
+    """
+    Read and decode every sample of an unshuffled dataset.
+
+    Returns:
+        entries(list): (index, description) of the samples failed
+    """
+
+    def check(idx):
+        try:
+            img, _ = dataset._load(idx)
+            if not isinstance(img, np.ndarray):
+                img = np.frombuffer(img, dtype='uint8')
+            return cv2.imdecode(img, 1) is not None
+        except Exception as e:
+            logger.error("check {} failed: {}".format(
+                dataset._describe(idx), e))
+            return False
+
+    bad = []
+    chunk = num_threads * 64
+    with ThreadPoolExecutor(num_threads) as pool:
+        for start in range(0, len(dataset), chunk):
+            indices = range(start, min(start + chunk, len(dataset)))
+            for idx, ok in zip(indices, pool.map(check, indices)):
+                if not ok:
+                    bad.append((idx, dataset._describe(idx)))
+            logger.info("checked {}/{} samples, {} bad".format(
+                indices[-1] + 1, len(dataset), len(bad)))
+    return bad
+
+
+class BadSampleHandler(object):
+    """
+    Replace blacklisted or unreadable samples with known-good ones.
+
+    Good samples are all samples but the blacklisted ones. Only the sorted
+    bad positions are kept, the k-th good position is computed from them.
+    Samples failed at runtime are flagged in an array shared with the
+    workers and are not used again. Failures, substitutions and the time
+    spent on substitutions are counted per worker.
+
+    Args:
+        num_samples(int): number of samples of the dataset
+        bad_positions(list): positions of the blacklisted samples
+        max_retries(int): max substitutes tried for one sample
+        num_workers(int): number of dataloader workers
+    """
+    FIELDS = ['failures', 'substitutes', 'substitute_time']
+
+    def __init__(self,
+                 num_samples,
+                 bad_positions=None,
+                 max_retries=10,
+                 num_workers=0):
+        bad = [] if bad_positions is None else bad_positions
+        self.bad = np.unique(np.asarray(bad, dtype='int64'))
+        self.num_good = num_samples - len(self.bad)
+        assert self.num_good > 0, "all samples are blacklisted"
+        # number of good positions before every bad position
+        self.good_before_bad = self.bad - np.arange(len(self.bad))
+        self.max_retries = max_retries
+        self.stats = WorkerStats(self.FIELDS, num_workers)
+        # RawArray is created before the workers fork, so they share it
+        self._failed = multiprocessing.RawArray('b', num_samples)
+        self._rng = None
+        self._rng_pid = None
+
+    @property
+    def failed(self):
+        """ flags of the samples failed at runtime """
+        return np.frombuffer(self._failed, dtype='int8')
+
+    def mark_failed(self, idx):
+        """ do not use the sample at idx again in any worker """
+        self.failed[idx] = 1
+
+    def is_bad(self, idx):
+        if self.failed[idx]:
+            return True
+        i = np.searchsorted(self.bad, idx)
+        return i < len(self.bad) and self.bad[i] == idx
+
+    def _random_state(self):
+        # forked workers inherit the state of the parent, so every process
+        # seeds its own from the OS
+        if self._rng_pid != os.getpid():
+            self._rng = np.random.RandomState()
+            self._rng_pid = os.getpid()
+        return self._rng
+
+    def substitute(self):
+        """ a random known-good position, not failed at runtime """
+        rng = self._random_state()
+        for _ in range(self.max_retries + 1):
+            k = rng.randint(0, self.num_good)
+            idx = k + int(
+                np.searchsorted(
+                    self.good_before_bad, k, side='right'))
+            if not self.failed[idx]:
+                break
+        return idx
+
+    def summary(self):
+        """ str for the training log, empty if nothing happened """
+        totals = self.stats.totals()
+        if totals['substitutes'] == 0:
+            return ''
+        return "bad_samples: {:d}, substitutes: {:d}, " \
+            "substitute_cost: {:.5f} s,".format(
+                int(totals['failures']), int(totals['substitutes']),
+                totals['substitute_time'] / totals['substitutes'])
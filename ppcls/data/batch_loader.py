@@ -0,0 +1,67 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+__all__ = ['HostBatchLoader']
+
+
+class HostBatchLoader(object):
+    """
+    Apply the batch ops to the batches of a loader in the trainer process.
+
+    The collate function of a DataLoader runs in its worker processes, so
+    the workers only stack the uint8 samples and the float32 batch made by
+    NormalizeBatch never crosses the process boundary.
+
+    Attributes of the loader, like batch_sampler, dataset and reset, are
+    those of the wrapped loader.
+
+    Args:
+        loader(DataLoader|SharedMemoryLoader): loader yielding the stacked
+            [images, labels] of every batch
+        batch_fn(callable): function of the numpy [images, labels] of a
+            batch, returning the fields of the batch
+    """
+
+    def __init__(self, loader, batch_fn):
+        self.loader = loader
+        self.batch_fn = batch_fn
+
+    def __getattr__(self, name):
+        if name == 'loader':
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _transform(self, batches):
+        for batch in batches:
+            yield self.batch_fn([
+                field if isinstance(field, np.ndarray) else field.numpy()
+                for field in batch
+            ])
+
+    def __iter__(self):
+        # the loader iterator is created by the caller, a DataLoader starts
+        # its workers on the thread which creates it
+        return self._transform(iter(self.loader()))
+
+    def __call__(self):
+        return self.__iter__()
@@ -0,0 +1,138 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .imaug import DecodeImage
+from .imaug import ResizeImage
+from .imaug import CropImage
+from .imaug.pipeline import FusedResizeCrop
+from ppcls.utils import logger
+
+__all__ = ['TransformCache', 'deterministic_prefix']
+
+# ops whose output only depends on their input
+DETERMINISTIC_OPS = (DecodeImage, ResizeImage, CropImage, FusedResizeCrop)
+
+
+def _fixed_shape(op):
+    """ whether the output shape of op is independent of the input shape """
+    if isinstance(op, (CropImage, FusedResizeCrop)):
+        return True
+    return isinstance(op, ResizeImage) and op.resize_short is None
+
+
+def deterministic_prefix(ops):
+    """
+    Length of the longest deterministic prefix of ops that ends with an op
+    of fixed output shape, 0 if there is no such prefix.
+    """
+    length = 0
+    for i, op in enumerate(ops):
+        if not isinstance(op, DETERMINISTIC_OPS):
+            break
+        if _fixed_shape(op):
+            length = i + 1
+    return length
+
+
+def cache_key(params, num_ops):
+    """ key of the cache, changes with the data and the cached transforms """
+    file_list = os.path.abspath(params['file_list'])
+    stat = os.stat(file_list)
+    desc = {
+        'file_list': file_list,
+        'file_list_stat': [stat.st_size, int(stat.st_mtime)],
+        'data_dir': os.path.abspath(params['data_dir']),
+        'format': params.get('format', 'common'),
+        'mode': params['mode'],
+        'shuffle_seed': params.get('shuffle_seed'),
+        'transforms': params['transforms'][:num_ops],
+    }
+    if params.get('fuse_ops', False):
+        # fused ops round slightly differently, keys without fuse_ops are
+        # kept so that existing caches stay valid
+        desc['fuse_ops'] = True
+    desc = json.dumps(desc, sort_keys=True, default=str)
+    return hashlib.md5(desc.encode('utf-8')).hexdigest()
+
+
+def _open_memmap(path, dtype, shape):
+    """ open a .npy memmap, create it first if it does not match """
+    if os.path.exists(path):
+        try:
+            array = np.lib.format.open_memmap(path, mode='r+')
+            if array.dtype == dtype and array.shape == shape:
+                return array
+        except ValueError:
+            pass
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    array = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=dtype, shape=shape)
+    del array
+    os.replace(tmp_path, path)
+    return np.lib.format.open_memmap(path, mode='r+')
+
+
+class TransformCache(object):
+    """
+    Cache the output of the deterministic prefix of a transform pipeline
+    in memory-mapped arrays on local disk. Samples are filled in the first
+    time they are read, so later epochs and later runs with the same data
+    and transforms skip decoding and resizing.
+
+    Args:
+        cache_dir(str): dir to save the cache
+        key(str): cache key, see cache_key
+        num_samples(int): number of samples
+        shape(tuple): shape of the cached images
+        dtype(str): dtype of the cached images
+    """
+
+    def __init__(self, cache_dir, key, num_samples, shape, dtype='uint8'):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        prefix = os.path.join(cache_dir, key)
+        self.shape = tuple(shape)
+        self.images = _open_memmap(prefix + '_images.npy',
+                                   np.dtype(dtype), (num_samples, ) + self.shape)
+        self.labels = _open_memmap(prefix + '_labels.npy',
+                                   np.dtype('int64'), (num_samples, ))
+        # the flag is set after the image and the label are written
+        self.flags = _open_memmap(prefix + '_flags.npy',
+                                  np.dtype('uint8'), (num_samples, ))
+        logger.info("use transform cache {}, {}/{} samples cached".format(
+            prefix, int(np.count_nonzero(self.flags)), num_samples))
+
+    def get(self, idx):
+        """ return (image, label) or None if the sample is not cached """
+        if not self.flags[idx]:
+            return None
+        # copy so that later in-place ops can not change the cache
+        return np.array(self.images[idx]), int(self.labels[idx])
+
+    def put(self, idx, img, label):
+        if img.shape != self.shape or img.dtype != self.images.dtype:
+            return
+        self.images[idx] = img
+        self.labels[idx] = label
+        self.flags[idx] = 1
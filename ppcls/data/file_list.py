@@ -0,0 +1,193 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import imghdr
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ppcls.utils import logger
+
+__all__ = ['CompactFileList', 'scan_image_dir']
+
+IMG_TYPES = {'jpg', 'bmp', 'png', 'jpeg', 'rgb', 'tif', 'tiff'}
+DEFAULT_SCAN_CACHE_DIR = os.path.expanduser('~/.cache/ppcls/file_lists')
+
+
+def _sniff(file_path):
+    """ whether file_path is an image, judged from its header """
+    try:
+        return imghdr.what(file_path) in IMG_TYPES
+    except (IOError, OSError):
+        # dirs and unreadable files
+        return False
+
+
+def scan_image_dir(data_dir, cache_dir=None, num_threads=16):
+    """
+    Create the file list of all images in data_dir, with label 0.
+    Headers are sniffed by a thread pool and the result is cached per dir,
+    keyed by the mtime of the dir, so later runs reuse it.
+
+    Args:
+        data_dir(str): dir of the images
+        cache_dir(str): dir to save the file lists
+        num_threads(int): threads used to sniff the headers
+
+    Returns:
+        path of the file list
+    """
+    cache_dir = cache_dir or DEFAULT_SCAN_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    data_dir = os.path.abspath(data_dir)
+    key = hashlib.md5(data_dir.encode('utf-8')).hexdigest()
+    file_list = os.path.join(cache_dir, "{}_{}.txt".format(
+        key, os.stat(data_dir).st_mtime_ns))
+    if os.path.exists(file_list):
+        return file_list
+
+    file_names = sorted(os.listdir(data_dir))
+    paths = [os.path.join(data_dir, name) for name in file_names]
+    with ThreadPoolExecutor(num_threads) as pool:
+        is_image = list(pool.map(_sniff, paths))
+    tmp_path = "{}.{}.tmp".format(file_list, os.getpid())
+    with open(tmp_path, "w") as fout:
+        for file_name, ok in zip(file_names, is_image):
+            if ok:
+                fout.write(file_name + " 0" + "\n")
+    os.replace(tmp_path, file_list)
+    logger.info("{} images found in {}, file list is cached in {}".format(
+        sum(is_image), data_dir, file_list))
+
+    # lists created before the dir changed are stale, .tmp files may be
+    # lists still being written by other jobs
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(key + '_') and name.endswith('.txt') and \
+                path != file_list:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return file_list
+
+
+def _index_prefix(file_list, cache_dir=None):
+    if cache_dir:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        return os.path.join(cache_dir, os.path.basename(file_list))
+    return file_list
+
+
+def _index_is_valid(file_list, prefix):
+    offsets_path = prefix + '_offsets.npy'
+    labels_path = prefix + '_labels.npy'
+    if not (os.path.exists(offsets_path) and os.path.exists(labels_path)):
+        return False
+    if os.path.getmtime(offsets_path) < os.path.getmtime(file_list):
+        return False
+    offsets = np.load(offsets_path, mmap_mode='r')
+    # the last offset is the size of the file list when it was indexed
+    return len(offsets) > 0 and offsets[-1] == os.path.getsize(file_list)
+
+
+def build_index(file_list, prefix, delimiter=' '):
+    """
+    Build the offsets of the lines and the labels of a file list.
+    offsets has one more item than labels, the size of the file list.
+    """
+    logger.info("building compact index of {}".format(file_list))
+    delimiter = delimiter.encode('utf-8')
+    offsets = array('q')
+    labels = array('i')
+    pos = 0
+    with open(file_list, 'rb') as flist:
+        for line in flist:
+            stripped = line.strip()
+            if stripped:
+                offsets.append(pos)
+                labels.append(int(stripped.rsplit(delimiter, 1)[1]))
+            pos += len(line)
+    offsets.append(pos)
+
+    for name, data, dtype in [('_labels.npy', labels, 'int32'),
+                              ('_offsets.npy', offsets, 'int64')]:
+        tmp_path = "{}{}.{}.tmp".format(prefix, name, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.frombuffer(data, dtype=dtype))
+        os.replace(tmp_path, prefix + name)
+    logger.info("compact index of {} lines is saved to {}_*.npy".format(
+        len(labels), prefix))
+
+
+class CompactFileList(object):
+    """
+    A file list stored as the memory-mapped text file, an int64 array of
+    line offsets and an int32 array of labels. Unlike a list of str it does
+    not create any Python object per line, so worker processes keep
+    sharing its pages after fork. Shuffling permutes an index array.
+
+    Args:
+        file_list(str): path of the file list
+        delimiter(str): delimiter between the image path and the label
+        cache_dir(str): dir to save the index, default is next to file_list
+    """
+
+    def __init__(self, file_list, delimiter=' ', cache_dir=None):
+        prefix = _index_prefix(file_list, cache_dir)
+        if not _index_is_valid(file_list, prefix):
+            build_index(file_list, prefix, delimiter)
+        self.delimiter = delimiter.encode('utf-8')
+        self.data = np.memmap(file_list, dtype='uint8', mode='r')
+        self.offsets = np.load(prefix + '_offsets.npy', mmap_mode='r')
+        self.labels = np.load(prefix + '_labels.npy', mmap_mode='r')
+        self.order = None
+
+    def shuffle(self, seed=None):
+        """ shuffle the order of the lines """
+        dtype = 'int32' if len(self) < 2**31 else 'int64'
+        order = np.arange(len(self), dtype=dtype)
+        if seed is not None:
+            np.random.RandomState(seed).shuffle(order)
+        else:
+            np.random.shuffle(order)
+        self.order = order
+        return self
+
+    def _line(self, idx):
+        if self.order is not None:
+            idx = self.order[idx]
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return idx, self.data[start:end].tobytes().strip()
+
+    def get(self, idx):
+        """ return the image path and the label of the idx-th line """
+        idx, line = self._line(idx)
+        img_path = line.rsplit(self.delimiter, 1)[0].strip()
+        return img_path.decode('utf-8'), int(self.labels[idx])
+
+    def __getitem__(self, idx):
+        return self._line(idx)[1].decode('utf-8')
+
+    def __len__(self):
+        return len(self.labels)
@@ -24,10 +24,15 @@ from .operators import DecodeImage
 from .operators import ResizeImage
 from .operators import CropImage
 from .operators import RandCropImage
+from .operators import DecodeRandCropImage
 from .operators import RandFlipImage
 from .operators import NormalizeImage
 from .operators import ToCHWImage
 
+from .batch_operators import NormalizeBatch
+from .batch_operators import BatchCutout
+from .batch_operators import BatchRandomErasing
+from .batch_operators import BatchHideAndSeek
 from .batch_operators import MixupOperator
 from .batch_operators import CutmixOperator
 from .batch_operators import FmixOperator
@@ -45,15 +50,26 @@ def transform(data, ops=[]):
 
 
 class AutoAugment(RawImageNetPolicy):
-    """ ImageNetPolicy wrapper to auto fit different img types """
+    """ ImageNetPolicy wrapper to auto fit different img types
+
+    If use_lut is True, numpy images are processed without PIL, and the
+    point-wise ops of a sub-policy are folded into one lookup table.
+    """
 
     def __init__(self, *args, **kwargs):
+        self.use_lut = kwargs.pop('use_lut', False)
         if six.PY2:
             super(AutoAugment, self).__init__(*args, **kwargs)
         else:
             super().__init__(*args, **kwargs)
 
     def __call__(self, img):
+        if self.use_lut:
+            if isinstance(img, Image.Image):
+                img = np.asarray(img)
+            img = np.ascontiguousarray(img)
+            return super(AutoAugment, self).__call__(img)
+
         if not isinstance(img, Image.Image):
             img = np.ascontiguousarray(img)
             img = Image.fromarray(img)
@@ -79,6 +95,13 @@ class RandAugment(RawRandAugment):
             super().__init__(*args, **kwargs)
 
     def __call__(self, img):
+        if self.backend == 'cv2':
+            # ops work on numpy images directly
+            if isinstance(img, Image.Image):
+                img = np.asarray(img)
+            img = np.ascontiguousarray(img)
+            return super(RandAugment, self).__call__(img)
+
         if not isinstance(img, Image.Image):
             img = np.ascontiguousarray(img)
             img = Image.fromarray(img)
@@ -18,6 +18,9 @@ from PIL import Image, ImageEnhance, ImageOps
 import numpy as np
 import random
 
+from .cv_ops import apply_ops
+from .cv_ops import build_ops
+
 
 class ImageNetPolicy(object):
     """ Randomly choose one of the best 24 Sub-policies on ImageNet.
@@ -250,13 +253,29 @@ class SubPolicy(object):
         }
 
         self.p1 = p1
+        self.name1 = operation1
         self.operation1 = func[operation1]
         self.magnitude1 = ranges[operation1][magnitude_idx1]
         self.p2 = p2
+        self.name2 = operation2
         self.operation2 = func[operation2]
         self.magnitude2 = ranges[operation2][magnitude_idx2]
+        # numpy images are processed by cv_ops
+        self.cv_ops = build_ops(fillcolor)
+
+    def _chosen_ops(self):
+        """ (name, magnitude) of the ops chosen, drawn lazily so that the
+        random numbers are drawn in the same order as the PIL ops """
+        if random.random() < self.p1:
+            yield self.name1, self.magnitude1
+        if random.random() < self.p2:
+            yield self.name2, self.magnitude2
 
     def __call__(self, img):
+        if isinstance(img, np.ndarray):
+            # point-wise ops are folded into one lookup table
+            return apply_ops(img, self._chosen_ops(), self.cv_ops)
+
         if random.random() < self.p1:
             img = self.operation1(img, self.magnitude1)
         if random.random() < self.p2:
@@ -19,7 +19,7 @@ from __future__ import unicode_literals
 
 import numpy as np
 
-from .fmix import sample_mask
+from .fmix import FMixSampler
 
 
 class BatchOperator(object):
@@ -29,18 +29,205 @@ class BatchOperator(object):
         pass
 
     def _unpack(self, batch):
-        """ _unpack """
-        assert isinstance(batch, list), \
-                'batch should be a list filled with tuples (img, label)'
-        bs = len(batch)
+        """ _unpack
+
+        batch is the stacked (imgs, labels), or a list of (img, label)
+        """
+        if isinstance(batch[0], np.ndarray):
+            imgs, labels = batch[0], batch[1]
+        else:
+            assert isinstance(batch, list), \
+                    'batch should be a list filled with tuples (img, label)'
+            assert len(batch) > 0, 'size of the batch data should > 0'
+            imgs, labels = list(zip(*batch))
+            imgs, labels = np.array(imgs), np.array(labels)
+        bs = len(imgs)
         assert bs > 0, 'size of the batch data should > 0'
-        imgs, labels = list(zip(*batch))
-        return np.array(imgs), np.array(labels), bs
+        if not np.issubdtype(imgs.dtype, np.floating):
+            imgs = imgs.astype('float32')
+        return imgs, labels, bs
+
+    def _take(self, imgs, idx):
+        """ imgs[idx] in a scratch buffer which is reused by later batches
+        """
+        scratch = getattr(self, '_scratch', None)
+        if scratch is None or scratch.shape != imgs.shape or \
+                scratch.dtype != imgs.dtype:
+            scratch = np.empty_like(imgs)
+            self._scratch = scratch
+        return np.take(imgs, idx, axis=0, out=scratch)
+
+    def _mix(self, imgs, idx, lam):
+        """ imgs = lam * imgs + (1 - lam) * imgs[idx] in place, lam is a
+        scalar or an array broadcast to imgs """
+        shuffled = self._take(imgs, idx)
+        imgs -= shuffled
+        imgs *= lam
+        imgs += shuffled
+        return imgs
 
     def __call__(self, batch):
         return batch
 
 
+class NormalizeBatch(BatchOperator):
+    """ cast, normalize and transpose a batch of images in one pass
+
+    The per-sample pipeline can end with uint8 hwc images, which are 4x
+    smaller than float32 ones when sent from the workers.
+
+    Args:
+        scale(float): scale of the pixel values
+        mean(list): mean of every channel
+        std(list): std of every channel
+        order(str): layout of the output, 'chw' or 'hwc'
+    """
+
+    def __init__(self, scale=None, mean=None, std=None, order='chw'):
+        if isinstance(scale, str):
+            scale = eval(scale)
+        scale = np.float32(scale if scale is not None else 1.0 / 255.0)
+        mean = mean if mean is not None else [0.485, 0.456, 0.406]
+        std = std if std is not None else [0.229, 0.224, 0.225]
+        assert order in ['chw', 'hwc'], \
+                "order should be 'chw' or 'hwc', but got {}".format(order)
+        self.order = order
+        # (x * scale - mean) / std == x * (scale / std) - mean / std
+        self.mul = (scale / np.array(std)).astype('float32')
+        self.sub = (np.array(mean) / np.array(std)).astype('float32')
+
+    def __call__(self, imgs):
+        """
+        Args:
+            imgs(np.ndarray): images in shape [N, H, W, C]
+
+        Returns:
+            float32 images in shape [N, C, H, W] or [N, H, W, C]
+        """
+        n, h, w, c = imgs.shape
+        assert c == len(self.mul), \
+                "expect {} channels, but got {}".format(len(self.mul), c)
+        if self.order == 'chw':
+            out = np.empty((n, c, h, w), dtype='float32')
+            for i in range(c):
+                np.multiply(imgs[..., i], self.mul[i], out=out[:, i])
+                out[:, i] -= self.sub[i]
+        else:
+            out = np.multiply(imgs, self.mul, dtype='float32')
+            out -= self.sub
+        return out
+
+
+def _rect_masks(h, w, y1, y2, x1, x2):
+    """
+    Boolean masks in shape [N, h, w] of the union of the rectangles
+    [y1, y2) x [x1, x2), the bounds are in shape [N, K] with K rects each.
+    """
+    rows = np.arange(h)
+    cols = np.arange(w)
+    in_rows = (rows >= y1[..., None]) & (rows < y2[..., None])
+    in_cols = (cols >= x1[..., None]) & (cols < x2[..., None])
+    return (in_rows[:, :, :, None] & in_cols[:, :, None, :]).any(axis=1)
+
+
+class BatchCutout(BatchOperator):
+    """ Cutout on a batch of images in nchw
+
+    Args:
+        n_holes(int): number of holes of every image
+        length(int): side length of the holes
+    """
+
+    def __init__(self, n_holes=1, length=112):
+        self.n_holes = n_holes
+        self.length = length
+
+    def __call__(self, imgs):
+        n, _, h, w = imgs.shape
+        y = np.random.randint(h, size=(n, self.n_holes))
+        x = np.random.randint(w, size=(n, self.n_holes))
+        half = self.length // 2
+        mask = _rect_masks(h, w,
+                           np.clip(y - half, 0, h),
+                           np.clip(y + half, 0, h),
+                           np.clip(x - half, 0, w), np.clip(x + half, 0, w))
+        np.copyto(imgs, 0, where=mask[:, None])
+        return imgs
+
+
+class BatchRandomErasing(BatchOperator):
+    """ RandomErasing on a batch of images in nchw. The 100 attempts of
+    every image are sampled at once and the first valid one is used.
+
+    Args:
+        EPSILON(float): probability to erase an image
+        sl(float): min area ratio of the erased rect
+        sh(float): max area ratio of the erased rect
+        r1(float): min aspect ratio of the erased rect
+        mean(list): value of every channel in the erased rect
+    """
+    ATTEMPTS = 100
+
+    def __init__(self, EPSILON=0.5, sl=0.02, sh=0.4, r1=0.3,
+                 mean=[0., 0., 0.]):
+        self.EPSILON = EPSILON
+        self.mean = mean
+        self.sl = sl
+        self.sh = sh
+        self.r1 = r1
+
+    def __call__(self, imgs):
+        n, c, h, w = imgs.shape
+        shape = (n, self.ATTEMPTS)
+        target_area = np.random.uniform(self.sl, self.sh, shape) * h * w
+        aspect_ratio = np.random.uniform(self.r1, 1 / self.r1, shape)
+        eh = np.round(np.sqrt(target_area * aspect_ratio)).astype('int64')
+        ew = np.round(np.sqrt(target_area / aspect_ratio)).astype('int64')
+        valid = (ew < w) & (eh < h)
+        first = valid.argmax(axis=1)
+        erase = valid.any(axis=1) & (np.random.rand(n) <= self.EPSILON)
+
+        k = np.arange(n)
+        eh = np.where(erase, eh[k, first], 0)
+        ew = np.where(erase, ew[k, first], 0)
+        y1 = (np.random.rand(n) * (h - eh + 1)).astype('int64')
+        x1 = (np.random.rand(n) * (w - ew + 1)).astype('int64')
+        mask = _rect_masks(h, w, y1[:, None], (y1 + eh)[:, None],
+                           x1[:, None], (x1 + ew)[:, None])
+        mean = self.mean if c == len(self.mean) else self.mean[1]
+        fill = np.asarray(mean, dtype=imgs.dtype).reshape(1, -1, 1, 1)
+        np.copyto(imgs, fill, where=mask[:, None])
+        return imgs
+
+
+class BatchHideAndSeek(BatchOperator):
+    """ HideAndSeek on a batch of images in nchw. Images with the same grid
+    size get their patch masks in one draw.
+
+    Args:
+        grid_sizes(list): possible grid sizes, 0 means no hiding
+        hide_prob(float): probability to hide a patch
+    """
+
+    def __init__(self, grid_sizes=[0, 16, 32, 44, 56], hide_prob=0.5):
+        self.grid_sizes = grid_sizes
+        self.hide_prob = hide_prob
+
+    def __call__(self, imgs):
+        n, _, h, w = imgs.shape
+        grids = np.random.choice(self.grid_sizes, n)
+        mask = np.zeros((n, h, w), dtype=bool)
+        for g in np.unique(grids):
+            if g == 0:
+                continue
+            idx = np.flatnonzero(grids == g)
+            hide = np.random.rand(len(idx), -(-h // g), -(-w // g)) \
+                <= self.hide_prob
+            mask[idx] = hide.repeat(g, axis=1).repeat(g, axis=2)[:, :h, :w]
+        np.copyto(imgs, 0, where=mask[:, None])
+        return imgs
+
+
 class MixupOperator(BatchOperator):
     """ Mixup operator """
 
@@ -53,9 +240,9 @@ class MixupOperator(BatchOperator):
         imgs, labels, bs = self._unpack(batch)
         idx = np.random.permutation(bs)
         lam = np.random.beta(self._alpha, self._alpha)
-        lams = np.array([lam] * bs, dtype=np.float32)
-        imgs = lam * imgs + (1 - lam) * imgs[idx]
-        return list(zip(imgs, labels, labels[idx], lams))
+        lams = np.full(bs, lam, dtype=np.float32)
+        imgs = self._mix(imgs, idx, lam)
+        return [imgs, labels, labels[idx], lams]
 
 
 class CutmixOperator(BatchOperator):
@@ -94,24 +281,33 @@ class CutmixOperator(BatchOperator):
         imgs[:, :, bbx1:bbx2, bby1:bby2] = imgs[idx, :, bbx1:bbx2, bby1:bby2]
         lam = 1 - (float(bbx2 - bbx1) * (bby2 - bby1) /
                    (imgs.shape[-2] * imgs.shape[-1]))
-        lams = np.array([lam] * bs, dtype=np.float32)
-        return list(zip(imgs, labels, labels[idx], lams))
+        lams = np.full(bs, lam, dtype=np.float32)
+        return [imgs, labels, labels[idx], lams]
 
 
 class FmixOperator(BatchOperator):
     """ Fmix operator """
 
-    def __init__(self, alpha=1, decay_power=3, max_soft=0., reformulate=False):
+    def __init__(self,
+                 alpha=1,
+                 decay_power=3,
+                 max_soft=0.,
+                 reformulate=False,
+                 bank_size=16,
+                 prefetch=False):
         self._alpha = alpha
         self._decay_power = decay_power
         self._max_soft = max_soft
         self._reformulate = reformulate
+        # masks are generated bank_size at a time, see FMixSampler
+        self._sampler = FMixSampler(alpha, decay_power, max_soft, reformulate,
+                                    bank_size, prefetch)
 
     def __call__(self, batch):
         imgs, labels, bs = self._unpack(batch)
         idx = np.random.permutation(bs)
         size = (imgs.shape[2], imgs.shape[3])
-        lam, mask = sample_mask(self._alpha, self._decay_power, \
-                size, self._max_soft, self._reformulate)
-        imgs = mask * imgs + (1 - mask) * imgs[idx]
-        return list(zip(imgs, labels, labels[idx], [lam] * bs))
+        lam, mask = self._sampler.sample(size)
+        imgs = self._mix(imgs, idx, mask)
+        lams = np.full(bs, lam, dtype=np.float32)
+        return [imgs, labels, labels[idx], lams]
@@ -0,0 +1,299 @@
+# Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+uint8 hwc numpy/cv2 versions of the PIL ops used by RandAugment and
+AutoAugment. Point-wise ops are 256-entry lookup tables, some of which
+depend on the per-channel histograms of their input. Geometric ops follow
+the coordinate conventions of PIL.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+
+import cv2
+import numpy as np
+
+# weights of ITU-R 601-2 luma, used by PIL to convert RGB to L
+LUMA = np.array([0.299, 0.587, 0.114])
+IDENTITY = np.arange(256)
+
+
+def to_uint8(lut):
+    return np.clip(lut, 0, 255).astype('uint8')
+
+
+def apply_lut(img, lut):
+    """
+    Args:
+        img(np.ndarray): uint8 image in hwc or hw
+        lut(np.ndarray): uint8 table in shape [256] or [channels, 256]
+    """
+    if lut.ndim == 1:
+        return cv2.LUT(img, lut)
+    if img.ndim == 2:
+        return cv2.LUT(img, lut[0])
+    return cv2.LUT(img, np.ascontiguousarray(lut.T).reshape(1, 256, -1))
+
+
+def histograms(img):
+    """ histograms of every channel, in shape [channels, 256] """
+    img = img.reshape(img.shape[0], img.shape[1], -1)
+    return np.stack([
+        cv2.calcHist([img], [c], None, [256], [0, 256]).ravel()
+        for c in range(img.shape[2])
+    ])
+
+
+# tables of the ops which only depend on their magnitude, by (op, magnitude)
+_LUT_CACHE = {}
+
+
+def cached_lut(name, make_lut, magnitude):
+    """ make_lut(magnitude), built once for every (name, magnitude) """
+    key = (name, magnitude)
+    lut = _LUT_CACHE.get(key)
+    if lut is None:
+        lut = make_lut(magnitude)
+        # shared by all calls, must not be written
+        lut.setflags(write=False)
+        _LUT_CACHE[key] = lut
+    return lut
+
+
+def posterize_lut(bits):
+    bits = int(bits)
+    return (IDENTITY & ~(2**(8 - bits) - 1)).astype('uint8')
+
+
+def solarize_lut(threshold):
+    return np.where(IDENTITY < threshold, IDENTITY,
+                    255 - IDENTITY).astype('uint8')
+
+
+def invert_lut():
+    return (255 - IDENTITY).astype('uint8')
+
+
+def blend_lut(degenerate, factor):
+    """ lut of PIL Image.blend(degenerate, img, factor), which truncates """
+    return to_uint8(degenerate + factor * (IDENTITY - degenerate))
+
+
+def brightness_lut(factor):
+    return blend_lut(0, factor)
+
+
+def contrast_lut(hist, factor):
+    """ lut of ImageEnhance.Contrast, blending with the mean of luma """
+    if len(hist) == 1:
+        mean = hist[0].dot(IDENTITY) / max(hist[0].sum(), 1)
+    else:
+        means = hist.dot(IDENTITY) / np.maximum(hist.sum(axis=1), 1)
+        mean = means[:3].dot(LUMA)
+    return blend_lut(int(mean + 0.5), factor)
+
+
+def autocontrast_lut(hist):
+    """ lut of ImageOps.autocontrast without cutoff, per channel """
+    luts = []
+    for h in hist:
+        nonzero = np.flatnonzero(h)
+        if len(nonzero) == 0 or nonzero[-1] <= nonzero[0]:
+            luts.append(IDENTITY)
+            continue
+        lo, hi = nonzero[0], nonzero[-1]
+        scale = 255.0 / (hi - lo)
+        luts.append((IDENTITY * scale - lo * scale).astype('int64'))
+    return to_uint8(np.stack(luts))
+
+
+def equalize_lut(hist):
+    """ lut of ImageOps.equalize, per channel """
+    luts = []
+    for h in hist.astype('int64'):
+        nonzero = h[h > 0]
+        step = (nonzero.sum() - nonzero[-1]) // 255 \
+            if len(nonzero) > 1 else 0
+        if not step:
+            luts.append(IDENTITY)
+            continue
+        # cumulative count before every value
+        before = np.concatenate([[0], np.cumsum(h)[:-1]])
+        luts.append((step // 2 + before) // step)
+    return to_uint8(np.stack(luts))
+
+
+def affine(img, matrix, fillcolor, interpolation):
+    """
+    Same as PIL Image.transform(size, Image.AFFINE, matrix), which maps the
+    centers of the output pixels to the input image.
+    """
+    a, b, c, d, e, f = matrix
+    m = np.array(
+        [[a, b, c + 0.5 * (a + b - 1)], [d, e, f + 0.5 * (d + e - 1)]],
+        dtype='float64')
+    h, w = img.shape[:2]
+    return cv2.warpAffine(
+        img,
+        m, (w, h),
+        flags=interpolation | cv2.WARP_INVERSE_MAP,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=tuple(fillcolor))
+
+
+def rotate(img, degrees, fillcolor=(128, 128, 128)):
+    """ rotate counter clockwise around the center, like PIL rotate """
+    h, w = img.shape[:2]
+    m = cv2.getRotationMatrix2D(((w - 1) * 0.5, (h - 1) * 0.5), degrees, 1.0)
+    return cv2.warpAffine(
+        img,
+        m, (w, h),
+        flags=cv2.INTER_NEAREST,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=tuple(fillcolor))
+
+
+def gray(img):
+    """ luma of a RGB image, replicated to 3 channels """
+    return cv2.cvtColor(
+        cv2.cvtColor(img, cv2.COLOR_RGB2GRAY), cv2.COLOR_GRAY2RGB)
+
+
+def blend(degenerate, img, factor):
+    return cv2.addWeighted(img, factor, degenerate, 1 - factor, 0)
+
+
+def color(img, factor):
+    return blend(gray(img), img, factor)
+
+
+# kernel of PIL ImageFilter.SMOOTH
+SMOOTH = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype='float32') / 13.
+
+
+def sharpness(img, factor):
+    degenerate = cv2.filter2D(img, -1, SMOOTH)
+    # PIL keeps the borders
+    degenerate[0, :] = img[0, :]
+    degenerate[-1, :] = img[-1, :]
+    degenerate[:, 0] = img[:, 0]
+    degenerate[:, -1] = img[:, -1]
+    return blend(degenerate, img, factor)
+
+
+# point-wise ops as functions of (histograms of the input, magnitude)
+POINT_OPS = {
+    "posterize": lambda hist, magnitude: cached_lut(
+        "posterize", posterize_lut, magnitude),
+    "solarize": lambda hist, magnitude: cached_lut(
+        "solarize", solarize_lut, magnitude),
+    "invert": lambda hist, magnitude: cached_lut(
+        "invert", lambda _: invert_lut(), None),
+    "brightness": lambda hist, magnitude: cached_lut(
+        "brightness", brightness_lut, 1 + magnitude * random.choice([-1, 1])),
+    "contrast": lambda hist, magnitude: contrast_lut(
+        hist, 1 + magnitude * random.choice([-1, 1])),
+    "autocontrast": lambda hist, magnitude: autocontrast_lut(hist),
+    "equalize": lambda hist, magnitude: equalize_lut(hist),
+}
+
+
+def apply_ops(img, ops, fallback_ops):
+    """
+    Apply ops in order. Consecutive point-wise ops are composed into one
+    lookup table per channel, which is applied in a single pass. The
+    histograms needed by contrast, autocontrast and equalize are computed
+    once from the input of the run and mapped through the composed table.
+    Other ops are applied with fallback_ops.
+
+    Args:
+        img(np.ndarray): uint8 image in hwc
+        ops(list): (name, magnitude) of the ops
+        fallback_ops(dict): ops taking (img, magnitude), see build_ops
+    """
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    lut = None
+    src_hist = None
+    for name, magnitude in ops:
+        if name not in POINT_OPS:
+            if lut is not None:
+                img = apply_lut(img, lut.astype('uint8'))
+                lut = None
+            img = fallback_ops[name](img, magnitude)
+            continue
+
+        if lut is None:
+            lut = np.tile(IDENTITY, (channels, 1))
+            src_hist = histograms(img)
+        # histograms of the image after the composed table
+        hist = np.stack([
+            np.bincount(
+                lut[c], weights=src_hist[c], minlength=256)
+            for c in range(channels)
+        ])
+        op_lut = np.broadcast_to(POINT_OPS[name](hist, magnitude),
+                                 (channels, 256))
+        lut = np.take_along_axis(op_lut, lut, axis=1)
+    if lut is not None:
+        img = apply_lut(img, lut.astype('uint8'))
+    return img
+
+
+def build_ops(fillcolor=(128, 128, 128)):
+    """
+    Ops taking (img, magnitude) with the same random signs and magnitudes
+    as the PIL ops of RandAugment and AutoAugment.
+    """
+    rnd_ch_op = random.choice
+
+    return {
+        "shearX": lambda img, magnitude: affine(
+            img, (1, magnitude * rnd_ch_op([-1, 1]), 0, 0, 1, 0),
+            fillcolor, cv2.INTER_CUBIC),
+        "shearY": lambda img, magnitude: affine(
+            img, (1, 0, 0, magnitude * rnd_ch_op([-1, 1]), 1, 0),
+            fillcolor, cv2.INTER_CUBIC),
+        "translateX": lambda img, magnitude: affine(
+            img, (1, 0, magnitude * img.shape[1] * rnd_ch_op([-1, 1]),
+                  0, 1, 0),
+            fillcolor, cv2.INTER_NEAREST),
+        "translateY": lambda img, magnitude: affine(
+            img, (1, 0, 0, 0, 1,
+                  magnitude * img.shape[0] * rnd_ch_op([-1, 1])),
+            fillcolor, cv2.INTER_NEAREST),
+        "rotate": lambda img, magnitude: rotate(img, magnitude, fillcolor),
+        "color": lambda img, magnitude: color(
+            img, 1 + magnitude * rnd_ch_op([-1, 1])),
+        "posterize": lambda img, magnitude: apply_lut(
+            img, cached_lut("posterize", posterize_lut, magnitude)),
+        "solarize": lambda img, magnitude: apply_lut(
+            img, cached_lut("solarize", solarize_lut, magnitude)),
+        "contrast": lambda img, magnitude: apply_lut(
+            img, contrast_lut(histograms(img),
+                              1 + magnitude * rnd_ch_op([-1, 1]))),
+        "sharpness": lambda img, magnitude: sharpness(
+            img, 1 + magnitude * rnd_ch_op([-1, 1])),
+        "brightness": lambda img, magnitude: apply_lut(
+            img, cached_lut("brightness", brightness_lut,
+                            1 + magnitude * rnd_ch_op([-1, 1]))),
+        "autocontrast": lambda img, magnitude: apply_lut(
+            img, autocontrast_lut(histograms(img))),
+        "equalize": lambda img, magnitude: apply_lut(
+            img, equalize_lut(histograms(img))),
+        "invert": lambda img, magnitude: apply_lut(
+            img, cached_lut("invert", lambda _: invert_lut(), None))
+    }
@@ -13,9 +13,13 @@
 # limitations under the License.
 
 import math
+import os
 import random
+import threading
+from collections import deque
 
 import numpy as np
+from six.moves import queue
 from scipy.stats import beta
 
 
@@ -161,6 +165,155 @@ def sample_mask(alpha, decay_power, shape, max_soft=0.0, reformulate=False):
     return float(lam), mask
 
 
+class FMixSampler(object):
+    """ Stateful sampler of FMix masks
+
+    The frequency grid and its decayed scale only depend on the mask shape and
+    decay power, so they are cached per shape. Masks are generated in banks:
+    the spectra of bank_size masks are inverted by one batched irfftn and
+    binarised together by ranking their pixels. With prefetch, the next bank
+    is generated on a background thread while the current one is consumed.
+
+    :param alpha: Alpha value for beta distribution from which to sample mean of mask
+    :param decay_power: Decay power for frequency decay prop 1/f**d
+    :param max_soft: Softening value between 0 and 0.5 which smooths hard edges in the mask.
+    :param reformulate: If True, uses the reformulation of [1].
+    :param bank_size: Number of masks generated at once
+    :param prefetch: If True, generate the next bank on a background thread
+    """
+
+    def __init__(self,
+                 alpha=1,
+                 decay_power=3,
+                 max_soft=0.0,
+                 reformulate=False,
+                 bank_size=16,
+                 prefetch=False):
+        assert bank_size > 0, "bank_size should > 0"
+        self.alpha = alpha
+        self.decay_power = decay_power
+        self.max_soft = max_soft
+        self.reformulate = reformulate
+        self.bank_size = bank_size
+        self.prefetch = prefetch
+        self._scales = {}
+        self._bank = deque()
+        self._key = None
+        self._queue = None
+        self._stop = None
+
+    def _scale(self, shape):
+        """ decayed scale of the frequency grid of shape, cached """
+        scale = self._scales.get(shape)
+        if scale is None:
+            freqs = fftfreqnd(*shape)
+            scale = 1. / (np.maximum(freqs, 1. / max(shape))**
+                          self.decay_power)
+            self._scales[shape] = scale
+        return scale
+
+    def generate(self, shape, n, rng=None):
+        """ Generate n (lam, mask) pairs of shape at once
+
+        :param shape: Shape of desired masks, list up to 3 dims
+        :param n: Number of masks
+        :param rng: RandomState to draw from, default is the global one
+        :return: lams in shape [n] and float32 masks in shape [n, *shape]
+        """
+        rng = rng or np.random
+        shape = tuple(shape)
+        if self.reformulate:
+            lams = rng.beta(self.alpha + 1, self.alpha, size=n)
+        else:
+            lams = rng.beta(self.alpha, self.alpha, size=n)
+
+        scale = self._scale(shape)
+        # make_low_freq_image takes the real and imaginary parts from the
+        # first two entries of the first axis of the scaled spectrum, only
+        # those are drawn
+        param = rng.randn(n, 2, *(scale.shape[1:] + (2, )))
+        param *= scale[None, :2, ..., None]
+        spectrum = param[:, 0] + 1j * param[:, 1]
+        axes = tuple(range(-len(shape), 0))
+        low_freq = np.fft.irfftn(spectrum, shape, axes=axes).reshape(n, -1)
+
+        # the mask only depends on the order of the pixels of the low
+        # frequency image, the top num pixels are 1 and the rest are 0
+        size = low_freq.shape[1]
+        num = np.where(rng.rand(n) > 0.5,
+                       np.ceil(lams * size), np.floor(lams * size))
+        eff_soft = np.minimum(self.max_soft, np.minimum(lams, 1 - lams))
+        soft = (size * eff_soft).astype('int64')
+        masks = np.empty((n, size), dtype='float32')
+        if not soft.any():
+            # hard masks only need the num largest pixels, not a sort,
+            # exactly num of them are 1 even if some values are equal
+            masks[...] = 0
+            for i in range(n):
+                k = int(num[i])
+                if k <= 0 or k >= size:
+                    masks[i] = k > 0
+                    continue
+                masks[i, np.argpartition(-low_freq[i], k - 1)[:k]] = 1
+            return lams, masks.reshape((n, ) + shape)
+
+        order = np.argsort(-low_freq, axis=1)
+        num_low = (num - soft)[:, None]
+        num_high = (num + soft)[:, None]
+        rank = np.arange(size)[None]
+        # linspace(1, 0, num_high - num_low) between num_low and num_high
+        ramp = 1. - (rank - num_low) / np.maximum(num_high - num_low - 1, 1)
+        values = np.where(rank < num_low, 1.,
+                          np.where(rank >= num_high, 0., ramp))
+        np.put_along_axis(masks, order, values.astype('float32'), axis=1)
+        return lams, masks.reshape((n, ) + shape)
+
+    def _worker(self, shape, rng, bank_queue, stop):
+        while not stop.is_set():
+            bank = self.generate(shape, self.bank_size, rng)
+            while not stop.is_set():
+                try:
+                    bank_queue.put(bank, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _start_prefetch(self, shape):
+        if self._stop is not None:
+            self._stop.set()
+        self._queue = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+        rng = np.random.RandomState(np.random.randint(0, 2**31))
+        t = threading.Thread(
+            target=self._worker, args=(shape, rng, self._queue, self._stop))
+        t.daemon = True
+        t.start()
+
+    def sample(self, shape):
+        """ Sample a lambda and a mask in shape (1, 1, *shape)
+
+        :param shape: Shape of desired mask, list up to 3 dims
+        """
+        if isinstance(shape, int):
+            shape = (shape, )
+        shape = tuple(shape)
+        # banks and threads are not shared by forked workers
+        key = (os.getpid(), shape)
+        if key != self._key:
+            self._key = key
+            self._bank.clear()
+            if self.prefetch:
+                self._start_prefetch(shape)
+        if not self._bank:
+            if self.prefetch:
+                lams, masks = self._queue.get()
+            else:
+                lams, masks = self.generate(shape, self.bank_size)
+            self._bank.extend(zip(lams, masks))
+        lam, mask = self._bank.popleft()
+        return float(lam), mask[None, None]
+
+
 def sample_and_apply(x,
                      alpha,
                      decay_power,
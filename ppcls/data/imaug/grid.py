@@ -14,76 +14,89 @@
 
 # This code is based on https://github.com/akuxcw/GridMask
 
+import os
+
 import numpy as np
-from PIL import Image
-import pdb
 
-# curr
-CURR_EPOCH = 0
-# epoch for the prob to be the upper limit
-NUM_EPOCHS = 240
+from .cv_ops import rotate
 
 
 class GridMask(object):
-    def __init__(self, d1=96, d2=224, rotate=1, ratio=0.5, mode=0, prob=1.):
+    """
+    Args:
+        d1(int): min size of the grid unit
+        d2(int): max size of the grid unit
+        rotate(int): rotation of the mask is sampled in [0, rotate) degrees
+        ratio(float): ratio of the masked part of a grid unit
+        mode(int): 1 to keep the grid lines and mask the rest
+        prob(float): probability when epoch reaches num_epochs
+        num_epochs(int): probability increases linearly to prob in
+            num_epochs epochs, see set_epoch
+        bank_size(int): if > 0, so many masks are generated by every
+            worker on the first call and sampled afterwards
+    """
+
+    def __init__(self,
+                 d1=96,
+                 d2=224,
+                 rotate=1,
+                 ratio=0.5,
+                 mode=0,
+                 prob=1.,
+                 num_epochs=240,
+                 bank_size=0):
         self.d1 = d1
         self.d2 = d2
         self.rotate = rotate
         self.ratio = ratio
         self.mode = mode
         self.st_prob = prob
-        self.prob = prob
-        self.last_prob = -1
+        self.num_epochs = num_epochs
+        self.bank_size = bank_size
+        self.bank = None
+        self.bank_key = None
+        self.set_epoch(0)
 
-    def set_prob(self):
-        global CURR_EPOCH
-        global NUM_EPOCHS
-        self.prob = self.st_prob * min(1, 1.0 * CURR_EPOCH / NUM_EPOCHS)
+    def set_epoch(self, epoch):
+        """ called by the dataset at the start of every epoch """
+        self.prob = self.st_prob * min(1, 1.0 * epoch / self.num_epochs)
 
-    def __call__(self, img):
-        self.set_prob()
-        if abs(self.last_prob - self.prob) > 1e-10:
-            global CURR_EPOCH
-            global NUM_EPOCHS
-            print(
-                "self.prob is updated, self.prob={}, CURR_EPOCH: {}, NUM_EPOCHS: {}".
-                format(self.prob, CURR_EPOCH, NUM_EPOCHS))
-            self.last_prob = self.prob
-        # print("CURR_EPOCH: {}, NUM_EPOCHS: {}, self.prob is set as: {}".format(CURR_EPOCH, NUM_EPOCHS, self.prob) )
-        if np.random.rand() > self.prob:
-            return img
-        _, h, w = img.shape
+    def make_mask(self, h, w):
+        """ sample a uint8 mask in shape [h, w] """
         hh = int(1.5 * h)
         ww = int(1.5 * w)
         d = np.random.randint(self.d1, self.d2)
-        #d = self.d
-        self.l = int(d * self.ratio + 0.5)
-        mask = np.ones((hh, ww), np.float32)
+        l = int(d * self.ratio + 0.5)
         st_h = np.random.randint(d)
         st_w = np.random.randint(d)
-        for i in range(-1, hh // d + 1):
-            s = d * i + st_h
-            t = s + self.l
-            s = max(min(s, hh), 0)
-            t = max(min(t, hh), 0)
-            mask[s:t, :] *= 0
-        for i in range(-1, ww // d + 1):
-            s = d * i + st_w
-            t = s + self.l
-            s = max(min(s, ww), 0)
-            t = max(min(t, ww), 0)
-            mask[:, s:t] *= 0
+        # rows and cols on the grid lines, which start every d pixels
+        rows = (np.arange(hh) - st_h) % d < l
+        cols = (np.arange(ww) - st_w) % d < l
+        mask = (~(rows[:, None] | cols[None, :])).astype('uint8')
         r = np.random.randint(self.rotate)
-        mask = Image.fromarray(np.uint8(mask))
-        mask = mask.rotate(r)
-        mask = np.asarray(mask)
+        if r != 0:
+            mask = rotate(mask, r, fillcolor=(0, ))
         mask = mask[(hh - h) // 2:(hh - h) // 2 + h, (ww - w) // 2:(ww - w) //
                     2 + w]
 
         if self.mode == 1:
             mask = 1 - mask
+        return mask
 
-        mask = np.expand_dims(mask, axis=0)
-        img = (img * mask).astype(img.dtype)
+    def _sample_mask(self, h, w):
+        if self.bank_size <= 0:
+            return self.make_mask(h, w)
+        # the bank is built in every worker, and again if the size changes
+        key = (os.getpid(), h, w)
+        if self.bank_key != key:
+            self.bank = np.stack(
+                [self.make_mask(h, w) for _ in range(self.bank_size)])
+            self.bank_key = key
+        return self.bank[np.random.randint(self.bank_size)]
 
-        return img
+    def __call__(self, img):
+        if np.random.rand() > self.prob:
+            return img
+        _, h, w = img.shape
+        mask = self._sample_mask(h, w)
+        return (img * mask[None]).astype(img.dtype, copy=False)
@@ -43,13 +43,19 @@ class DecodeImage(object):
         self.channel_first = channel_first  # only enabled when to_np is True
 
     def __call__(self, img):
-        if six.PY2:
-            assert type(img) is str and len(
-                img) > 0, "invalid input 'img' in DecodeImage"
+        if isinstance(img, np.ndarray):
+            # encoded image sliced from a memory-mapped packed shard
+            assert img.dtype == np.uint8 and img.size > 0, \
+                "invalid input 'img' in DecodeImage"
+            data = img
         else:
-            assert type(img) is bytes and len(
-                img) > 0, "invalid input 'img' in DecodeImage"
-        data = np.frombuffer(img, dtype='uint8')
+            if six.PY2:
+                assert type(img) is str and len(
+                    img) > 0, "invalid input 'img' in DecodeImage"
+            else:
+                assert type(img) is bytes and len(
+                    img) > 0, "invalid input 'img' in DecodeImage"
+            data = np.frombuffer(img, dtype='uint8')
         img = cv2.imdecode(data, 1)
         if self.to_rgb:
             assert img.shape[2] == 3, 'invalid shape of image[%s]' % (
@@ -128,8 +134,13 @@ class RandCropImage(object):
         self.scale = [0.08, 1.0] if scale is None else scale
         self.ratio = [3. / 4., 4. / 3.] if ratio is None else ratio
 
-    def __call__(self, img):
-        size = self.size
+    def set_size(self, size):
+        """ set the output size, used by progressive resizing """
+        self.size = (size, size) if type(size) is int else tuple(size)
+
+    def crop_window(self, img_w, img_h):
+        """ sample a crop window (x, y, w, h) of an image in size img_w*img_h
+        """
         scale = self.scale
         ratio = self.ratio
 
@@ -137,8 +148,6 @@ class RandCropImage(object):
         w = 1. * aspect_ratio
         h = 1. / aspect_ratio
 
-        img_h, img_w = img.shape[:2]
-
         bound = min((float(img_w) / img_h) / (w**2),
                     (float(img_h) / img_w) / (h**2))
         scale_max = min(scale[1], bound)
@@ -151,12 +160,113 @@ class RandCropImage(object):
 
         i = random.randint(0, img_w - w)
         j = random.randint(0, img_h - h)
+        return i, j, w, h
 
-        img = img[j:j + h, i:i + w, :]
+    def resize(self, img):
         if self.interpolation is None:
-            return cv2.resize(img, size)
+            return cv2.resize(img, self.size)
+        else:
+            return cv2.resize(img, self.size, interpolation=self.interpolation)
+
+    def __call__(self, img):
+        img_h, img_w = img.shape[:2]
+        i, j, w, h = self.crop_window(img_w, img_h)
+        return self.resize(img[j:j + h, i:i + w, :])
+
+
+class DecodeRandCropImage(RandCropImage):
+    """ decode, random crop and resize image in one op
+
+    The crop window is sampled from the size in the image header before
+    decoding, then JPEG images are decoded at 1/2, 1/4 or 1/8 scale by
+    libjpeg when the window is still larger than size at that scale.
+    Other formats are fully decoded.
+
+    Args:
+        size(int|list): output size
+        scale(list): range of the area of the crop window
+        ratio(list): range of the aspect ratio of the crop window
+        interpolation(int): interpolation of cv2.resize
+        to_rgb(bool): whether to output rgb images
+        backend(str): 'cv2' for cv2.IMREAD_REDUCED_*, 'pil' for Image.draft
+    """
+
+    REDUCTIONS = (8, 4, 2)
+    CV2_FLAGS = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    def __init__(self,
+                 size,
+                 scale=None,
+                 ratio=None,
+                 interpolation=-1,
+                 to_rgb=True,
+                 backend='cv2'):
+        super(DecodeRandCropImage, self).__init__(size, scale, ratio,
+                                                  interpolation)
+        assert backend in ['cv2', 'pil'], \
+            "backend should be 'cv2' or 'pil', but got {}".format(backend)
+        self.to_rgb = to_rgb
+        self.backend = backend
+
+    def _reduction(self, w, h):
+        """ the largest reduction which keeps the window not smaller than
+        size """
+        for r in self.REDUCTIONS:
+            if w // r >= self.size[0] and h // r >= self.size[1]:
+                return r
+        return 1
+
+    def _decode_cv2(self, data, reduction):
+        img = cv2.imdecode(data, self.CV2_FLAGS[reduction])
+        assert img is not None, "failed to decode image"
+        return img[:, :, ::-1] if self.to_rgb else img
+
+    def _decode_pil(self, pil_img, img_w, img_h, reduction):
+        from PIL import ImageOps
+        if reduction > 1:
+            pil_img.draft('RGB', (img_w // reduction, img_h // reduction))
+        img = np.asarray(ImageOps.exif_transpose(pil_img).convert('RGB'))
+        return img if self.to_rgb else img[:, :, ::-1]
+
+    def __call__(self, img):
+        from PIL import Image
+        if not isinstance(img, np.ndarray):
+            img = np.frombuffer(img, dtype='uint8')
+        assert img.dtype == np.uint8 and img.size > 0, \
+            "invalid input 'img' in DecodeRandCropImage"
+
+        try:
+            pil_img = Image.open(six.BytesIO(img.tobytes()))
+            img_w, img_h = pil_img.size
+            # decoders apply the exif orientation
+            if pil_img.getexif().get(0x0112) in (5, 6, 7, 8):
+                img_w, img_h = img_h, img_w
+        except Exception:
+            # unknown header, decode it fully
+            return super(DecodeRandCropImage, self).__call__(
+                self._decode_cv2(img, 1))
+
+        i, j, w, h = self.crop_window(img_w, img_h)
+        reduction = 1
+        if pil_img.format == 'JPEG':
+            reduction = self._reduction(w, h)
+        if self.backend == 'pil':
+            decoded = self._decode_pil(pil_img, img_w, img_h, reduction)
         else:
-            return cv2.resize(img, size, interpolation=self.interpolation)
+            decoded = self._decode_cv2(img, reduction)
+
+        # map the window to the decoded image, whose size is rounded up
+        sx = float(decoded.shape[1]) / img_w
+        sy = float(decoded.shape[0]) / img_h
+        x0, y0 = int(i * sx), int(j * sy)
+        x1 = max(min(int(round((i + w) * sx)), decoded.shape[1]), x0 + 1)
+        y1 = max(min(int(round((j + h) * sy)), decoded.shape[0]), y0 + 1)
+        return self.resize(decoded[y0:y1, x0:x1, :])
 
 
 class RandFlipImage(object):
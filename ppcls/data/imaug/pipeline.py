@@ -0,0 +1,207 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compile a list of ops by fusing known sequences of them into single ops,
+other ops are kept as they are:
+
+    ResizeImage + CropImage -> FusedResizeCrop, one warpAffine of the crop
+    NormalizeImage(hwc) + ToCHWImage -> FusedNormalizeCHW, one pass
+
+Run this module to check the fused ops against the original ones:
+
+    python -m ppcls.data.imaug.pipeline
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import cv2
+import numpy as np
+
+from .operators import CropImage
+from .operators import NormalizeImage
+from .operators import ResizeImage
+from .operators import ToCHWImage
+
+__all__ = [
+    'FusedResizeCrop', 'FusedNormalizeCHW', 'compile_pipeline', 'verify'
+]
+
+# interpolations of cv2.resize that warpAffine samples the same way,
+# None is the default of cv2.resize
+FUSIBLE_INTERPOLATIONS = (None, cv2.INTER_LINEAR, cv2.INTER_CUBIC)
+
+
+class FusedResizeCrop(object):
+    """ ResizeImage followed by CropImage, computed by a single warpAffine
+    which only samples the pixels inside the crop window
+
+    Args:
+        resize(ResizeImage): the resize op
+        crop(CropImage): the crop op
+    """
+
+    def __init__(self, resize, crop):
+        self.resize = resize
+        self.crop = crop
+        self.interpolation = cv2.INTER_LINEAR \
+            if resize.interpolation is None else resize.interpolation
+
+    def __call__(self, img):
+        img_h, img_w = img.shape[:2]
+        if self.resize.resize_short is not None:
+            percent = float(self.resize.resize_short) / min(img_w, img_h)
+            w = int(round(img_w * percent))
+            h = int(round(img_h * percent))
+        else:
+            w = self.resize.w
+            h = self.resize.h
+        crop_w, crop_h = self.crop.size
+        if crop_w > w or crop_h > h:
+            # CropImage truncates the window, keep its behavior
+            return self.crop(self.resize(img))
+        w_start = (w - crop_w) // 2
+        h_start = (h - crop_h) // 2
+
+        # cv2.resize maps the centers of the pixels, output x samples the
+        # input at (x + 0.5) / scale - 0.5, shifted by the crop window
+        scale_x = float(w) / img_w
+        scale_y = float(h) / img_h
+        matrix = np.array(
+            [[1. / scale_x, 0., (w_start + 0.5) / scale_x - 0.5],
+             [0., 1. / scale_y, (h_start + 0.5) / scale_y - 0.5]],
+            dtype='float64')
+        return cv2.warpAffine(
+            img,
+            matrix, (crop_w, crop_h),
+            flags=self.interpolation | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE)
+
+
+class FusedNormalizeCHW(object):
+    """ NormalizeImage in hwc followed by ToCHWImage. Every channel is scaled
+    and shifted in one pass, written into the chw output directly.
+
+    Args:
+        normalize(NormalizeImage): the normalize op, in hwc order
+    """
+
+    def __init__(self, normalize):
+        std = normalize.std.reshape(-1)
+        # (img * scale - mean) / std == img * mul - sub
+        self.mul = (normalize.scale / std).astype('float32')
+        self.sub = (normalize.mean.reshape(-1) / std).astype('float32')
+
+    def __call__(self, img):
+        from PIL import Image
+        if isinstance(img, Image.Image):
+            img = np.array(img)
+
+        assert isinstance(img, np.ndarray) and img.ndim == 3, \
+            "invalid input 'img' in FusedNormalizeCHW"
+        h, w, c = img.shape
+        out = np.empty((c, h, w), dtype='float32')
+        for i in range(c):
+            np.multiply(img[:, :, i], self.mul[i], out=out[i])
+            out[i] -= self.sub[i]
+        return out
+
+
+def _fuse_resize_crop(resize, crop):
+    if resize.interpolation not in FUSIBLE_INTERPOLATIONS:
+        return None
+    return FusedResizeCrop(resize, crop)
+
+
+def _fuse_normalize_chw(normalize, to_chw):
+    if normalize.mean.shape != (1, 1, 3):
+        return None
+    return FusedNormalizeCHW(normalize)
+
+
+# (types of the op sequence, function returning the fused op or None)
+FUSION_RULES = [
+    ((ResizeImage, CropImage), _fuse_resize_crop),
+    ((NormalizeImage, ToCHWImage), _fuse_normalize_chw),
+]
+
+
+def compile_pipeline(ops):
+    """
+    Fuse the known sequences of ops, other ops are kept in place
+
+    Args:
+        ops(list): ops created by create_operators
+
+    Returns:
+        the compiled list of ops
+    """
+    compiled = []
+    i = 0
+    while i < len(ops):
+        for types, fuse in FUSION_RULES:
+            seq = ops[i:i + len(types)]
+            if len(seq) == len(types) and all(
+                    type(op) is t for op, t in zip(seq, types)):
+                fused = fuse(*seq)
+                if fused is not None:
+                    compiled.append(fused)
+                    i += len(types)
+                    break
+        else:
+            compiled.append(ops[i])
+            i += 1
+    return compiled
+
+
+def verify(ops, img):
+    """
+    Max absolute difference between the outputs of ops and of the compiled
+    ops on img. The ops should be deterministic.
+    """
+    from . import transform
+    expected = transform(img, ops)
+    actual = transform(img, compile_pipeline(ops))
+    assert expected.shape == actual.shape, \
+        "shape mismatch, expect {} but got {}".format(
+            expected.shape, actual.shape)
+    return float(
+        np.abs(expected.astype('float32') - actual.astype('float32')).max())
+
+
+if __name__ == '__main__':
+    # ResizeImage + CropImage differ by the fixed point rounding of cv2
+    # in uint8, about one level, normalized outputs by float rounding
+    np.random.seed(0)
+    img = cv2.GaussianBlur(
+        np.random.randint(
+            0, 256, (375, 500, 3), dtype='uint8'), (5, 5), 0)
+    cases = [
+        ([ResizeImage(resize_short=256), CropImage(size=224)], 2.),
+        ([ResizeImage(size=(320, 240)), CropImage(size=(200, 180))], 2.),
+        ([ResizeImage(
+            resize_short=256, interpolation=cv2.INTER_CUBIC),
+          CropImage(size=224)], 2.),
+        ([NormalizeImage(order=''), ToCHWImage()], 1e-4),
+        ([
+            ResizeImage(resize_short=256), CropImage(size=224),
+            NormalizeImage(order=''), ToCHWImage()
+        ], 0.05),
+    ]
+    for ops, atol in cases:
+        names = ' + '.join(type(op).__name__ for op in ops)
+        diff = verify(ops, img)
+        assert diff <= atol, "{}: max diff {} > {}".format(names, diff, atol)
+        print("{}: max diff {:.6f}, ok".format(names, diff))
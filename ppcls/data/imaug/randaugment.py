@@ -18,9 +18,27 @@ from PIL import Image, ImageEnhance, ImageOps
 import numpy as np
 import random
 
+from .cv_ops import build_ops
+
 
 class RandAugment(object):
-    def __init__(self, num_layers=2, magnitude=5, fillcolor=(128, 128, 128)):
+    """
+    Args:
+        num_layers(int): number of ops applied to every image
+        magnitude(int): magnitude of the ops, in [0, 10]
+        fillcolor(tuple): color of the pixels outside the image
+        backend(str): 'pil' for ops on PIL images, 'cv2' for ops on uint8
+            numpy images with cv2 and lookup tables
+    """
+
+    def __init__(self,
+                 num_layers=2,
+                 magnitude=5,
+                 fillcolor=(128, 128, 128),
+                 backend='pil'):
+        assert backend in ['pil', 'cv2'], \
+            "backend should be 'pil' or 'cv2', but got {}".format(backend)
+        self.backend = backend
         self.num_layers = num_layers
         self.magnitude = magnitude
         self.max_level = 10
@@ -43,6 +61,10 @@ class RandAugment(object):
             "invert": 0
         }
 
+        if backend == 'cv2':
+            self.func = build_ops(fillcolor)
+            return
+
         # from https://stackoverflow.com/questions/5252170/
         # specify-image-filling-color-when-rotating-in-python-with-pil-and-setting-expand
         def rotate_with_fill(img, magnitude):
@@ -0,0 +1,144 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Packed record-file format.
+
+Encoded images are concatenated into large shard files named
+`<name>-00000.rec`, `<name>-00001.rec`, ... and described by an index file
+`<name>.idx`, which is a .npy array of int64 with one row per sample:
+[shard_id, offset, length, label]. Shards are read through `mmap`, so
+fetching a sample is a slice of a memory-mapped buffer.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+
+__all__ = ['PackedWriter', 'PackedFile']
+
+INDEX_SUFFIX = '.idx'
+SHARD_SUFFIX = '.rec'
+
+
+def shard_path(data_dir, name, shard_id):
+    """ path of the shard_id-th shard of a packed dataset """
+    return os.path.join(data_dir,
+                        "{}-{:05d}{}".format(name, shard_id, SHARD_SUFFIX))
+
+
+def index_name(index_path):
+    """ name of a packed dataset, which is the basename of its index file """
+    return os.path.splitext(os.path.basename(index_path))[0]
+
+
+class PackedWriter(object):
+    """
+    Write encoded images and labels into packed shards
+
+    Args:
+        output_dir(str): dir to save the shards and the index file
+        name(str): name of the packed dataset
+        shard_size(int): a new shard is started once the current
+            one exceeds shard_size bytes
+    """
+
+    def __init__(self, output_dir, name, shard_size=1 << 30):
+        assert shard_size >= 0, 'shard_size should >= 0'
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        self.output_dir = output_dir
+        self.name = name
+        self.shard_size = shard_size
+        self.index = []
+        self.shard_id = -1
+        self.fout = None
+        self.offset = 0
+        self._next_shard()
+
+    def _next_shard(self):
+        if self.fout is not None:
+            self.fout.close()
+        self.shard_id += 1
+        self.offset = 0
+        self.fout = open(
+            shard_path(self.output_dir, self.name, self.shard_id), 'wb')
+
+    def write(self, img, label):
+        """
+        Args:
+            img(bytes): encoded image
+            label(int): label of the image
+        """
+        if self.offset > 0 and self.offset + len(img) > self.shard_size:
+            self._next_shard()
+        self.fout.write(img)
+        self.index.append((self.shard_id, self.offset, len(img), label))
+        self.offset += len(img)
+
+    def close(self):
+        """ close the last shard and write the index file """
+        self.fout.close()
+        index = np.array(self.index, dtype='int64').reshape(-1, 4)
+        index_path = os.path.join(self.output_dir, self.name + INDEX_SUFFIX)
+        with open(index_path, 'wb') as f:
+            np.save(f, index)
+        return index_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PackedFile(object):
+    """
+    Random access to a packed dataset
+
+    Args:
+        index_path(str): path of the index file
+        data_dir(str): dir of the shards, default is the dir of index_path
+    """
+
+    def __init__(self, index_path, data_dir=None):
+        self.index = np.load(index_path, mmap_mode='r')
+        assert self.index.ndim == 2 and self.index.shape[1] == 4, \
+            "invalid packed index file: {}".format(index_path)
+        self.name = index_name(index_path)
+        self.data_dir = data_dir or os.path.dirname(index_path)
+        # shards are mapped lazily so that every worker process owns its maps
+        self.shards = {}
+
+    def _shard(self, shard_id):
+        shard = self.shards.get(shard_id)
+        if shard is None:
+            shard = np.memmap(
+                shard_path(self.data_dir, self.name, shard_id),
+                dtype='uint8',
+                mode='r')
+            self.shards[shard_id] = shard
+        return shard
+
+    def __getitem__(self, idx):
+        """ return the encoded image as an uint8 array and its label """
+        shard_id, offset, length, label = self.index[idx]
+        img = self._shard(int(shard_id))[offset:offset + length]
+        return img, int(label)
+
+    def __len__(self):
+        return len(self.index)
@@ -0,0 +1,136 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import threading
+
+import numpy as np
+import paddle
+from six.moves import queue
+
+__all__ = ['DevicePrefetcher']
+
+# end of the batches of the loader
+_END = object()
+
+
+class DevicePrefetcher(object):
+    """
+    Copy the next batches of a loader to the device on a background thread,
+    while the current one is computed. Batches are yielded as the feed dict
+    of tools/program.py, the labels are already int64 columns and lam is a
+    float32 column, so the training loop does not convert them.
+
+    Attributes of the loader, like batch_sampler, dataset and reset, are
+    those of the wrapped loader.
+
+    Args:
+        loader(DataLoader|ThreadLoader|SharedMemoryLoader): loader yielding
+            [image, label] or [image, y_a, y_b, lam] with use_mix
+        use_mix(bool): whether the batches are mixed
+        places(Place|list): place of the feeds
+        prefetch(int): number of batches staged ahead
+    """
+
+    def __init__(self, loader, use_mix=False, places=None, prefetch=2):
+        assert prefetch > 0, "prefetch should > 0"
+        self.loader = loader
+        self.use_mix = use_mix
+        if isinstance(places, (list, tuple)):
+            places = places[0] if places else None
+        self.place = places
+        self.prefetch = prefetch
+
+    def __getattr__(self, name):
+        if name == 'loader':
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _tensor(self, field):
+        if isinstance(field, np.ndarray):
+            return paddle.to_tensor(field, place=self.place)
+        return field
+
+    def _column(self, field, dtype):
+        if isinstance(field, np.ndarray):
+            # the fields may be views of a buffer refilled by the loader,
+            # to_tensor copies them
+            return paddle.to_tensor(
+                field.astype(dtype, copy=False).reshape(-1, 1),
+                place=self.place)
+        return paddle.reshape(paddle.cast(field, dtype), [-1, 1])
+
+    def _feeds(self, batch):
+        feeds = {"image": self._tensor(batch[0])}
+        if self.use_mix:
+            feeds["y_a"] = self._column(batch[1], "int64")
+            feeds["y_b"] = self._column(batch[2], "int64")
+            feeds["lam"] = self._column(batch[3], "float32")
+        else:
+            feeds["label"] = self._column(batch[1], "int64")
+        return feeds
+
+    def _worker(self, batches, feed_queue, stop):
+        try:
+            for batch in batches:
+                feeds = self._feeds(batch)
+                while not stop.is_set():
+                    try:
+                        feed_queue.put((feeds, None), timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            feed_queue.put((_END, None))
+        except Exception:
+            feed_queue.put((None, sys.exc_info()[1]))
+
+    def __iter__(self):
+        # the iterator of a DataLoader with workers starts them and sets
+        # signal handlers, which is only allowed on the main thread, the
+        # background thread only takes the batches from it
+        batches = iter(self.loader())
+        feed_queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        t = threading.Thread(
+            target=self._worker, args=(batches, feed_queue, stop))
+        t.daemon = True
+        t.start()
+        try:
+            while True:
+                feeds, error = feed_queue.get()
+                if error is not None:
+                    raise error
+                if feeds is _END:
+                    break
+                yield feeds
+        finally:
+            stop.set()
+            # unblock the worker waiting for a free place in the queue
+            while t.is_alive():
+                try:
+                    feed_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def __call__(self):
+        return self.__iter__()
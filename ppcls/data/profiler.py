@@ -0,0 +1,148 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+
+from .stats import WorkerStats
+
+__all__ = ['OpProfiler']
+
+# counters of every op, shapes are summed as the last 3 dims
+FIELDS = ['calls', 'time', 'alloc_bytes'] + \
+    ['in_dim{}'.format(i) for i in range(3)] + \
+    ['out_dim{}'.format(i) for i in range(3)]
+
+
+def _describe(data):
+    """ (last 3 dims, array) of an image, a batch or the fields of one """
+    if isinstance(data, (list, tuple)) and len(data) > 0:
+        data = data[0]
+    if isinstance(data, np.ndarray):
+        shape = data.shape
+    elif hasattr(data, 'size') and hasattr(data, 'getbands'):
+        # PIL image
+        shape = (data.size[1], data.size[0], len(data.getbands()))
+        data = None
+    else:
+        return (0, 0, 0), None
+    return (tuple(shape[-3:]) + (0, 0, 0))[:3], data
+
+
+def _alloc_bytes(src, dst):
+    """ bytes of dst if it is a new array, not a view of src """
+    if dst is None:
+        return 0
+    if src is not None and np.may_share_memory(src, dst):
+        return 0
+    return dst.nbytes
+
+
+class ProfiledOp(object):
+    """ op recording its time and the shapes of its input and output into
+    a row of the counters of an OpProfiler """
+
+    def __init__(self, op, stats, offset):
+        self.op = op
+        self.stats = stats
+        self.indices = np.arange(offset, offset + len(FIELDS))
+
+    def __getattr__(self, name):
+        # set_epoch and other attributes of the op
+        if name == 'op':
+            raise AttributeError(name)
+        return getattr(self.op, name)
+
+    def __call__(self, data):
+        in_shape, src = _describe(data)
+        tic = time.time()
+        out = self.op(data)
+        elapsed = time.time() - tic
+        out_shape, dst = _describe(out)
+        self.stats.add_at(self.indices, [1, elapsed, _alloc_bytes(src, dst)] +
+                          list(in_shape) + list(out_shape))
+        return out
+
+
+class OpProfiler(object):
+    """
+    Record the wall time, the mean input and output shapes and the bytes
+    allocated of every op. The counters are shared with the dataloader
+    workers, so the table covers the ops run in all processes.
+
+    Args:
+        groups(list): (name, ops) of the op lists to profile, like
+            the transforms and the batch ops. The wrapped op lists are
+            in self.wrapped, in the same order
+        num_workers(int): number of dataloader workers
+        interval(int): number of batches between two tables
+    """
+
+    def __init__(self, groups, num_workers=0, interval=100):
+        self.interval = interval
+        self.names = []
+        ops_of_groups = []
+        for group, ops in groups:
+            # ops may be wrapped by an earlier profiler
+            ops = [op.op if isinstance(op, ProfiledOp) else op for op in ops]
+            self.names.extend("{}.{}".format(group, type(op).__name__)
+                              for op in ops)
+            ops_of_groups.append(ops)
+        self.stats = WorkerStats([
+            "{}:{}".format(i, field)
+            for i in range(len(self.names)) for field in FIELDS
+        ], num_workers)
+
+        # wrapped ops of every group
+        self.wrapped = []
+        offset = 0
+        for ops in ops_of_groups:
+            self.wrapped.append([
+                ProfiledOp(op, self.stats, (offset + k) * len(FIELDS))
+                for k, op in enumerate(ops)
+            ])
+            offset += len(ops)
+
+    def table(self):
+        """ str of the ops ranked by their total time """
+        totals = np.array(list(self.stats.totals().values())).reshape(
+            len(self.names), len(FIELDS))
+        total_time = max(totals[:, 1].sum(), 1e-12)
+        lines = [
+            "{:<32s} {:>9s} {:>10s} {:>7s} {:>9s} {:>16s} {:>16s} {:>10s}".
+            format('op', 'calls', 'total(s)', 'share', 'avg(ms)', 'in', 'out',
+                   'alloc(MB)')
+        ]
+        for i in np.argsort(-totals[:, 1], kind='stable'):
+            calls, op_time, alloc_bytes = totals[i, :3]
+            if calls == 0:
+                continue
+            dims = np.round(totals[i, 3:] / calls).astype('int64')
+            in_shape = 'x'.join(str(d) for d in dims[:3] if d)
+            out_shape = 'x'.join(str(d) for d in dims[3:] if d)
+            lines.append(
+                "{:<32s} {:>9d} {:>10.3f} {:>6.1f}% {:>9.3f} {:>16s} {:>16s} "
+                "{:>10.3f}".format(self.names[i][:32],
+                                   int(calls), op_time, 100. * op_time /
+                                   total_time, 1e3 * op_time / calls, in_shape,
+                                   out_shape, alloc_bytes / calls / 2**20))
+        return '\n'.join(lines)
+
+    def reset(self):
+        self.stats.reset()
@@ -12,16 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import multiprocessing
 import numpy as np
-import imghdr
 import os
 import signal
-import random
+import time
 
+import paddle
 from paddle.io import Dataset, DataLoader, DistributedBatchSampler
 
 from . import imaug
 from .imaug import transform
+from .imaug.pipeline import compile_pipeline
+from .packed import PackedFile
+from .cache import TransformCache
+from .cache import cache_key
+from .cache import deterministic_prefix
+from .file_list import CompactFileList
+from .file_list import scan_image_dir
+from .thread_loader import ThreadLoader
+from .shm_loader import SharedMemoryLoader
+from .prefetcher import DevicePrefetcher
+from .batch_loader import HostBatchLoader
+from .sampler import ResumableBatchSampler
+from .bad_sample import BadSampleHandler
+from .bad_sample import load_blacklist
+from .profiler import OpProfiler
+from .schedule import ResizeSchedule
 from ppcls.utils import logger
 
 trainers_num = int(os.environ.get('PADDLE_TRAINERS_NUM', 1))
@@ -95,16 +112,8 @@ def create_file_list(params):
     Args:
         params(dict):
     """
-    data_dir = params.get('data_dir', '')
-    params['file_list'] = ".tmp.txt"
-    imgtype_list = {'jpg', 'bmp', 'png', 'jpeg', 'rgb', 'tif', 'tiff'}
-    with open(params['file_list'], "w") as fout:
-        tmp_file_list = os.listdir(data_dir)
-        for file_name in tmp_file_list:
-            file_path = os.path.join(data_dir, file_name)
-            if imghdr.what(file_path) not in imgtype_list:
-                continue
-            fout.write(file_name + " 0" + "\n")
+    params['file_list'] = scan_image_dir(params.get('data_dir', ''),
+                                         params.get('cache_dir'))
 
 
 def shuffle_lines(full_lines, seed=None):
@@ -122,9 +131,24 @@ def shuffle_lines(full_lines, seed=None):
     return full_lines
 
 
+def to_positions(order, raw_indices):
+    """
+    positions of raw indices in a dataset shuffled by order
+
+    Args:
+        order(np.ndarray|None): shuffled raw indices, None if not shuffled
+        raw_indices(list): indices in the unshuffled dataset
+    """
+    raw_indices = np.asarray(raw_indices, dtype='int64')
+    if order is None:
+        return raw_indices
+    return np.flatnonzero(np.isin(order, raw_indices))
+
+
 def get_file_list(params):
     """
-    read label list from file and shuffle the list
+    read label list from file and shuffle the list,
+    return a CompactFileList if use_compact_file_list is set
 
     Args:
         params(dict):
@@ -132,6 +156,14 @@ def get_file_list(params):
     if params['mode'] == 'test':
         create_file_list(params)
 
+    if params.get('use_compact_file_list', False):
+        full_lines = CompactFileList(params['file_list'],
+                                     params.get('delimiter', ' '),
+                                     params.get('cache_dir'))
+        if params["mode"] == "train":
+            full_lines.shuffle(seed=params['shuffle_seed'])
+        return full_lines
+
     with open(params['file_list']) as flist:
         full_lines = [line.strip() for line in flist]
 
@@ -180,25 +212,237 @@ class CommonDataset(Dataset):
         self.delimiter = params.get('delimiter', ' ')
         self.ops = create_operators(params['transforms'])
         self.num_samples = len(self.full_lines)
+        self._init_bad_samples()
+        self._init_cache()
+        self._compile_ops()
+        self._init_epoch()
         return
 
-    def __getitem__(self, idx):
-        try:
+    def _init_cache(self):
+        """
+        cache the output of the deterministic prefix of the transforms
+        if cache_dir is set
+        """
+        self.cache = None
+        self.cache_ops = 0
+        cache_dir = self.params.get('cache_dir')
+        if not cache_dir or self.num_samples == 0:
+            return
+        if self.mode == "train" and self.params.get('shuffle_seed') is None:
+            # the samples are indexed in the shuffled order, which changes
+            # from run to run without a seed
+            logger.warning("shuffle_seed of train mode is not set, the "
+                           "transform cache is disabled")
+            return
+        num_ops = deterministic_prefix(self.ops)
+        if num_ops == 0:
+            logger.warning("transforms of {} mode have no deterministic "
+                           "prefix with fixed output shape, the transform "
+                           "cache is disabled".format(self.mode))
+            return
+        img = self._probe(num_ops)
+        key = cache_key(self.params, num_ops)
+        self.cache = TransformCache(cache_dir, key, self.num_samples,
+                                    img.shape, img.dtype)
+        self.cache_ops = num_ops
+
+    def _probe(self, num_ops):
+        """
+        output of the first num_ops transforms on the first readable sample,
+        skipping the blacklist and unreadable samples like __getitem__
+        """
+        handler = self.bad_samples
+        failures = 0
+        for idx in range(self.num_samples):
+            if handler.is_bad(idx):
+                continue
+            try:
+                img, _ = self._load(idx)
+                return transform(img, self.ops[:num_ops])
+            except Exception as e:
+                logger.error("data read faild: {}, exception info: {}".format(
+                    self._describe(idx), e))
+                handler.mark_failed(idx)
+                failures += 1
+                if failures > handler.max_retries:
+                    break
+        raise RuntimeError("failed to read {} samples in a row, please check "
+                           "the dataset".format(failures))
+
+    def _compile_ops(self):
+        """
+        fuse known sequences of the transforms if fuse_ops is set, the
+        cached prefix and the rest are compiled separately
+        """
+        if not self.params.get('fuse_ops', False):
+            return
+        head = compile_pipeline(self.ops[:self.cache_ops])
+        tail = compile_pipeline(self.ops[self.cache_ops:])
+        if len(head) + len(tail) < len(self.ops):
+            logger.info("transforms of {} mode are compiled to {}".format(
+                self.mode, [type(op).__name__ for op in head + tail]))
+        self.ops = head + tail
+        if self.cache is not None:
+            self.cache_ops = len(head)
+
+    def _init_bad_samples(self):
+        """
+        load the blacklist generated by tools/check_data.py if it is set
+        """
+        bad_positions = None
+        blacklist = self.params.get('blacklist')
+        if blacklist:
+            entries = load_blacklist(blacklist)
+            bad_positions = self._bad_positions(entries)
+            logger.info("{} samples in blacklist {}, {} of them are in the "
+                        "dataset".format(
+                            len(entries), blacklist, len(bad_positions)))
+        self.bad_samples = BadSampleHandler(
+            self.num_samples, bad_positions,
+            self.params.get('max_retries', 10),
+            self.params.get('num_workers', 0))
+
+    def _init_epoch(self):
+        # shared with the worker processes, which sync their ops lazily
+        self.epoch = multiprocessing.RawValue('i', 0)
+        self.synced_epoch = None
+        self.resize_schedule = None
+        if self.params.get('progressive_resize'):
+            self.resize_schedule = ResizeSchedule(
+                self.params['progressive_resize'], self.params['batch_size'])
+
+    def set_epoch(self, epoch):
+        """ set the epoch of the ops with a set_epoch method, like GridMask,
+        and the size of the ops with a set_size method if progressive_resize
+        is set """
+        self.epoch.value = epoch
+
+    def _sync_epoch(self):
+        epoch = self.epoch.value
+        if epoch == self.synced_epoch:
+            return
+        stage = None
+        if self.resize_schedule is not None:
+            stage = self.resize_schedule.stage(epoch)
+        for op in self.ops:
+            if hasattr(op, 'set_epoch'):
+                op.set_epoch(epoch)
+            if stage is not None and hasattr(op, 'set_size'):
+                op.set_size(stage[0])
+        self.synced_epoch = epoch
+
+    def _bad_positions(self, entries):
+        """ positions of the blacklist entries in this dataset """
+        if isinstance(self.full_lines, CompactFileList):
+            return to_positions(self.full_lines.order,
+                                [raw_idx for raw_idx, _ in entries])
+        descs = set(desc for _, desc in entries)
+        return [i for i, line in enumerate(self.full_lines) if line in descs]
+
+    def _get_sample(self, idx):
+        """ return the transformed image and the label of a sample """
+        if self.cache is None:
+            img, label = self._load(idx)
+            return transform(img, self.ops), label
+
+        sample = self.cache.get(idx)
+        if sample is None:
+            img, label = self._load(idx)
+            img = transform(img, self.ops[:self.cache_ops])
+            self.cache.put(idx, img, label)
+        else:
+            img, label = sample
+        return transform(img, self.ops[self.cache_ops:]), label
+
+    def _describe(self, idx):
+        """ readable description of a sample, used in logs """
+        return self.full_lines[idx]
+
+    def _load(self, idx):
+        """ return the encoded image and the label of a sample """
+        if isinstance(self.full_lines, CompactFileList):
+            img_path, label = self.full_lines.get(idx)
+        else:
             line = self.full_lines[idx]
             img_path, label = line.split(self.delimiter)
-            img_path = os.path.join(self.params['data_dir'], img_path)
-            with open(img_path, 'rb') as f:
-                img = f.read()
-            return (transform(img, self.ops), int(label))
-        except Exception as e:
-            logger.error("data read faild: {}, exception info: {}".format(line,
-                                                                          e))
-            return self.__getitem__(random.randint(0, len(self)))
+        img_path = os.path.join(self.params['data_dir'], img_path)
+        with open(img_path, 'rb') as f:
+            img = f.read()
+        return img, int(label)
+
+    def __getitem__(self, idx):
+        self._sync_epoch()
+        handler = self.bad_samples
+        tic = None
+        if handler.is_bad(idx):
+            tic = time.time()
+            idx = handler.substitute()
+        for _ in range(handler.max_retries + 1):
+            try:
+                sample = self._get_sample(idx)
+                break
+            except Exception as e:
+                logger.error("data read faild: {}, exception info: {}".format(
+                    self._describe(idx), e))
+                handler.mark_failed(idx)
+                handler.stats.add('failures')
+                tic = tic or time.time()
+                idx = handler.substitute()
+        else:
+            raise RuntimeError("failed to read {} samples in a row, please "
+                               "check the dataset".format(handler.max_retries
+                                                          + 1))
+        if tic is not None:
+            handler.stats.add('substitutes')
+            handler.stats.add('substitute_time', time.time() - tic)
+        return sample
 
     def __len__(self):
         return self.num_samples
 
 
+class PackedDataset(CommonDataset):
+    """
+    Dataset reading samples from packed shards, see ppcls/data/packed.py.
+    file_list is the index file and data_dir is the dir of the shards.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.mode = params.get("mode", "train")
+        self.packed = PackedFile(params['file_list'], params['data_dir'])
+        self.ops = create_operators(params['transforms'])
+        self.num_samples = len(self.packed)
+        self.order = None
+        if self.mode == "train":
+            self.order = shuffle_lines(
+                np.arange(self.num_samples), seed=params['shuffle_seed'])
+        self._init_bad_samples()
+        self._init_cache()
+        self._compile_ops()
+        self._init_epoch()
+        return
+
+    def _describe(self, idx):
+        if self.order is not None:
+            idx = self.order[idx]
+        shard_id, offset, _, _ = self.packed.index[idx]
+        return "{}-{:05d} offset {}".format(self.packed.name, shard_id, offset)
+
+    def _bad_positions(self, entries):
+        return to_positions(self.order, [raw_idx for raw_idx, _ in entries])
+
+    def _load(self, idx):
+        if self.order is not None:
+            idx = self.order[idx]
+        return self.packed[idx]
+
+
+DATASET_FORMATS = {'common': CommonDataset, 'packed': PackedDataset}
+
+LOADER_MODES = ['process', 'thread', 'shared_memory']
+
+
 class Reader:
     """
     Create a reader for trainning/validate/test
@@ -224,44 +468,132 @@ class Reader:
 
         self.collate_fn = None
         self.batch_ops = []
+        self.batch_transforms = []
+        if self.params.get('batch_transforms'):
+            self.batch_transforms = create_operators(self.params[
+                'batch_transforms'])
+            self.collate_fn = self.batch_collate_fn
         if use_mix and mode == "train":
             self.batch_ops = create_operators(self.params['mix'])
-            self.collate_fn = self.mix_collate_fn
+            self.collate_fn = self.batch_collate_fn
 
         self.places = places
 
-    def mix_collate_fn(self, batch):
-        batch = transform(batch, self.batch_ops)
-        # batch each field
-        slots = []
-        for items in batch:
-            for i, item in enumerate(items):
-                if len(slots) < len(items):
-                    slots.append([item])
-                else:
-                    slots[i].append(item)
-
-        return [np.stack(slot, axis=0) for slot in slots]
+    def _stack(self, batch):
+        """ stack the images and the labels of the samples once """
+        imgs, labels = list(zip(*batch))
+        return np.stack(imgs, axis=0), np.array(labels, dtype='int64')
+
+    def transform_batch(self, fields):
+        """ apply batch_transforms and the mix ops to [imgs, labels] """
+        imgs, labels = fields
+        if self.batch_transforms:
+            imgs = transform(imgs, self.batch_transforms)
+        if not self.batch_ops:
+            return [imgs, labels]
+        # mix ops work in place on the stacked batch and return the fields
+        return transform((imgs, labels), self.batch_ops)
+
+    def batch_collate_fn(self, batch):
+        return self.transform_batch(self._stack(batch))
+
+    def stack_collate_fn(self, batch):
+        return list(self._stack(batch))
+
+    def _prefetch(self, loader):
+        """ stage the feeds of the next batches on the device if set """
+        device_prefetch = self.params.get('device_prefetch', 0)
+        if device_prefetch <= 0:
+            return loader
+        return DevicePrefetcher(
+            loader,
+            use_mix=bool(self.batch_ops),
+            places=self.places,
+            prefetch=device_prefetch)
 
     def __call__(self):
         batch_size = int(self.params['batch_size']) // trainers_num
 
-        dataset = CommonDataset(self.params)
+        data_format = self.params.get('format', 'common')
+        assert data_format in DATASET_FORMATS, \
+            "format should be one of {}, but got {}".format(
+                list(DATASET_FORMATS), data_format)
+        dataset = DATASET_FORMATS[data_format](self.params)
+
+        profile_interval = self.params.get('profile_interval', 0)
+        if profile_interval > 0:
+            # time every op in the workers, see tools/program.py
+            profiler = OpProfiler(
+                [('transforms', dataset.ops),
+                 ('batch_transforms', self.batch_transforms),
+                 ('mix', self.batch_ops)],
+                num_workers=self.params["num_workers"],
+                interval=profile_interval)
+            dataset.ops, self.batch_transforms, self.batch_ops = \
+                profiler.wrapped
+            dataset.op_profiler = profiler
 
         is_train = self.params['mode'] == "train"
-        batch_sampler = DistributedBatchSampler(
-            dataset,
-            batch_size=batch_size,
-            shuffle=self.shuffle and is_train,
-            drop_last=is_train)
-        loader = DataLoader(
-            dataset,
-            batch_sampler=batch_sampler,
-            collate_fn=self.collate_fn if is_train else None,
-            places=self.places,
-            return_list=True,
-            num_workers=self.params["num_workers"])
-        return loader
+        if is_train and self.params.get('resumable', False):
+            seed = self.params.get('shuffle_seed')
+            assert seed is not None, \
+                "shuffle_seed should be set for a resumable reader"
+            batch_sampler = ResumableBatchSampler(
+                dataset,
+                batch_size=batch_size,
+                shuffle=self.shuffle,
+                drop_last=True,
+                seed=seed)
+        else:
+            batch_sampler = DistributedBatchSampler(
+                dataset,
+                batch_size=batch_size,
+                shuffle=self.shuffle and is_train,
+                drop_last=is_train)
+
+        loader_mode = self.params.get('loader_mode', 'process')
+        assert loader_mode in LOADER_MODES, \
+            "loader_mode should be one of {}, but got {}".format(
+                LOADER_MODES, loader_mode)
+        if not paddle.in_dynamic_mode():
+            # the static mode feeds the tensors of a DataLoader
+            assert loader_mode == 'process', \
+                "loader_mode {} is only supported in dynamic mode".format(
+                    loader_mode)
+            assert self.params.get('device_prefetch', 0) <= 0, \
+                "device_prefetch is only supported in dynamic mode"
+        if loader_mode == 'thread':
+            return self._prefetch(
+                ThreadLoader(
+                    dataset,
+                    batch_sampler,
+                    collate_fn=self.collate_fn,
+                    num_threads=max(self.params["num_workers"], 1),
+                    places=self.places))
+
+        # the worker processes only stack the uint8 samples, batch_transforms
+        # run in the trainer, the static mode feeds the loader output as is
+        on_host = bool(self.batch_transforms) and paddle.in_dynamic_mode()
+        if loader_mode == 'shared_memory':
+            loader = SharedMemoryLoader(
+                dataset,
+                batch_sampler,
+                collate_fn=None if on_host else self.collate_fn,
+                num_workers=max(self.params["num_workers"], 1),
+                num_slots=self.params.get("num_slots"))
+        else:
+            loader = DataLoader(
+                dataset,
+                batch_sampler=batch_sampler,
+                collate_fn=self.stack_collate_fn
+                if on_host else self.collate_fn,
+                # the batches go back to numpy for the batch ops
+                places=paddle.CPUPlace() if on_host else self.places,
+                return_list=True,
+                num_workers=self.params["num_workers"])
+        if on_host:
+            loader = HostBatchLoader(loader, self.transform_batch)
+        return self._prefetch(loader)
 
 
 signal.signal(signal.SIGINT, term_mp)
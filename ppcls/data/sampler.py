@@ -0,0 +1,112 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+
+import numpy as np
+import paddle
+from paddle.io import BatchSampler
+
+__all__ = ['ResumableBatchSampler']
+
+
+class ResumableBatchSampler(BatchSampler):
+    """
+    Distributed batch sampler whose order is a pure function of
+    (seed, epoch), and which can start an epoch at any step, so that a
+    training resumed from a mid-epoch checkpoint sees the same samples in
+    the same order as if it had not been stopped.
+
+    Like DistributedBatchSampler, the permutation is padded to a multiple
+    of num_replicas and every replica takes one of every num_replicas
+    samples.
+
+    Args:
+        dataset(Dataset): dataset to sample
+        batch_size(int): batch size of every replica
+        shuffle(bool): whether to shuffle the samples every epoch
+        drop_last(bool): whether to drop the last incomplete batch
+        seed(int): random seed, should be the same in all replicas
+        num_replicas(int): number of replicas, default is the world size
+        rank(int): rank of the current replica, default is the current rank
+    """
+
+    def __init__(self,
+                 dataset,
+                 batch_size,
+                 shuffle=False,
+                 drop_last=False,
+                 seed=0,
+                 num_replicas=None,
+                 rank=None):
+        assert batch_size > 0, "batch_size should > 0"
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.nranks = num_replicas or paddle.distributed.get_world_size()
+        self.local_rank = paddle.distributed.get_rank() \
+            if rank is None else rank
+        self.num_samples = int(
+            math.ceil(len(self.dataset) * 1.0 / self.nranks))
+        self.total_size = self.num_samples * self.nranks
+        self.epoch = 0
+        self.start_step = 0
+
+    def set_epoch(self, epoch):
+        """ set the epoch of the next iteration, which starts at step 0 """
+        self.epoch = epoch
+        self.start_step = 0
+
+    def set_start_step(self, step):
+        """ skip the first step batches of the current epoch """
+        assert 0 <= step <= self.steps_per_epoch(), \
+            "start step {} is out of range [0, {}]".format(
+                step, self.steps_per_epoch())
+        self.start_step = step
+
+    def steps_per_epoch(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def indices(self):
+        """ indices of the samples of the current replica in this epoch """
+        n = len(self.dataset)
+        if self.shuffle:
+            indices = np.random.RandomState(
+                (self.seed + self.epoch) % (2**32)).permutation(n)
+        else:
+            indices = np.arange(n)
+        # pad so that every replica has num_samples samples
+        pad = self.total_size - n
+        if pad > 0:
+            indices = np.concatenate(
+                [indices, np.resize(indices, pad)])
+        return indices[self.local_rank:self.total_size:self.nranks]
+
+    def __iter__(self):
+        indices = self.indices()
+        for step in range(self.start_step, self.steps_per_epoch()):
+            batch = indices[step * self.batch_size:(step + 1) *
+                            self.batch_size]
+            yield batch.tolist()
+
+    def __len__(self):
+        return self.steps_per_epoch() - self.start_step
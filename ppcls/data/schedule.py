@@ -0,0 +1,57 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ['ResizeSchedule']
+
+
+class ResizeSchedule(object):
+    """
+    Progressive resizing, the crop size and the batch size of every stage of
+    the training. A stage starts at its epoch and lasts until the next one,
+    epochs before the first stage use the sizes of the config.
+
+    The batch size of a stage defaults to batch_size scaled by the area of
+    the last stage over the area of the stage, so that a batch has about
+    the same number of pixels in all stages.
+
+    Args:
+        stages(list): dicts of epoch, size and optionally batch_size
+        batch_size(int): batch size of the config, over all trainers
+    """
+
+    def __init__(self, stages, batch_size):
+        assert isinstance(stages, list) and len(stages) > 0, \
+            "progressive_resize should be a list of stages"
+        self.stages = []
+        for stage in sorted(stages, key=lambda s: s['epoch']):
+            assert stage['size'] > 0, "size of a stage should > 0"
+            self.stages.append((int(stage['epoch']), int(stage['size']),
+                                stage.get('batch_size')))
+        self.batch_size = batch_size
+        full_size = self.stages[-1][1]
+        self.stages = [(epoch, size, int(stage_bs) if stage_bs else max(
+            1, int(batch_size * (float(full_size) / size)**2)))
+                       for epoch, size, stage_bs in self.stages]
+
+    def stage(self, epoch):
+        """ (size, batch_size) of epoch, None before the first stage """
+        current = None
+        for start, size, batch_size in self.stages:
+            if epoch >= start:
+                current = (size, batch_size)
+        return current
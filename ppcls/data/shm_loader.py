@@ -0,0 +1,246 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import mmap
+import multiprocessing
+import random
+import traceback
+
+from six.moves import queue
+
+import numpy as np
+
+from .stats import set_worker_id
+
+__all__ = ['SharedMemoryLoader']
+
+# seconds between two checks of the workers while waiting for a batch
+POLL_INTERVAL = 5
+
+
+class SlotRing(object):
+    """
+    Preallocated batch slots in an anonymous shared memory map. The map is
+    created before the workers fork, so the workers and the trainer see the
+    same pages. Every slot holds the fields of one batch.
+
+    Args:
+        num_slots(int): number of slots
+        batch_size(int): max number of samples of a batch
+        fields(list): (shape, dtype) of a sample of every field
+    """
+
+    def __init__(self, num_slots, batch_size, fields):
+        self.num_slots = num_slots
+        self.batch_size = batch_size
+        self.fields = [(tuple(shape), np.dtype(dtype))
+                       for shape, dtype in fields]
+        self.offsets = []
+        slot_bytes = 0
+        for shape, dtype in self.fields:
+            # align every field to 64 bytes
+            slot_bytes = (slot_bytes + 63) // 64 * 64
+            self.offsets.append(slot_bytes)
+            slot_bytes += batch_size * int(np.prod(shape)) * dtype.itemsize
+        self.slot_bytes = (slot_bytes + 63) // 64 * 64
+        self.buffer = mmap.mmap(-1, max(self.slot_bytes * num_slots, 1))
+
+    def views(self, slot, n=None):
+        """ views of the first n samples of every field in a slot """
+        n = self.batch_size if n is None else n
+        base = slot * self.slot_bytes
+        return [
+            np.ndarray(
+                (n, ) + shape,
+                dtype=dtype,
+                buffer=self.buffer,
+                offset=base + offset)
+            for (shape, dtype), offset in zip(self.fields, self.offsets)
+        ]
+
+    def matches(self, fields):
+        """ whether a batch of fields fits in a slot """
+        return len(fields) == len(self.fields) and all(
+            f.shape[1:] == shape and len(f) <= self.batch_size
+            for f, (shape, _) in zip(fields, self.fields))
+
+
+def _worker_loop(dataset, collate_fn, ring, task_queue, ready_queue,
+                 worker_id, seed):
+    set_worker_id(worker_id)
+    random.seed(seed)
+    np.random.seed(seed % (2**32))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_id, slot, indices = task
+        try:
+            views = ring.views(slot, len(indices))
+            if collate_fn is None:
+                imgs, labels = views
+                for k, idx in enumerate(indices):
+                    imgs[k], labels[k] = dataset[idx]
+            else:
+                fields = collate_fn([dataset[idx] for idx in indices])
+                assert ring.matches(fields), \
+                    "fields of the batch do not match the slot"
+                for view, field in zip(views, fields):
+                    view[...] = field
+            ready_queue.put((batch_id, slot, len(indices), None))
+        except Exception:
+            ready_queue.put((batch_id, slot, 0, traceback.format_exc()))
+
+
+def _check_alive(workers):
+    """ raise if a worker died, e.g. killed by the OOM killer """
+    for i, w in enumerate(workers):
+        if not w.is_alive():
+            raise RuntimeError(
+                "shared_memory loader worker {} (pid {}) exited "
+                "unexpectedly with exit code {}".format(i, w.pid, w.exitcode))
+
+
+class SharedMemoryLoader(object):
+    """
+    Load batches in worker processes which write them in place into a ring
+    of shared memory slots, so no batch is pickled or copied on its way to
+    the trainer.
+
+    Only slot ids and batch indices travel through the queues. A batch is
+    sent to the workers only when a slot is free, and the slot of a batch
+    is freed when the next batch is requested, so the workers wait when the
+    trainer falls behind, and at most num_slots batches are loaded ahead.
+    The yielded arrays are views of a slot, they are only valid until the
+    next batch is requested.
+
+    Args:
+        dataset(Dataset): dataset returning (img, label)
+        batch_sampler(BatchSampler): sampler of the indices of the batches
+        collate_fn(callable): function to merge a list of samples into
+            a list of arrays, if None samples are stacked in place
+        num_workers(int): number of worker processes
+        num_slots(int): number of slots, default is 2 * num_workers
+    """
+
+    def __init__(self,
+                 dataset,
+                 batch_sampler,
+                 collate_fn=None,
+                 num_workers=4,
+                 num_slots=None):
+        assert num_workers > 0, "num_workers should > 0"
+        assert hasattr(mmap, 'MAP_SHARED'), \
+            "shared_memory loader is only supported on unix"
+        self.dataset = dataset
+        self.batch_sampler = batch_sampler
+        self.collate_fn = collate_fn
+        self.num_workers = num_workers
+        self.num_slots = num_slots or 2 * num_workers
+        assert self.num_slots > 0, "num_slots should > 0"
+        self.ring = None
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def reset(self):
+        """ drop the slots, which are created again from the next batch,
+        when the batch size or the shape of the samples changes """
+        self.ring = None
+
+    def _create_ring(self, indices):
+        """ create the slots from the fields of a probe batch """
+        samples = [self.dataset[idx] for idx in indices]
+        if self.collate_fn is None:
+            img = np.asarray(samples[0][0])
+            fields = [(img.shape, img.dtype), ((), 'int64')]
+        else:
+            fields = [(f.shape[1:], f.dtype)
+                      for f in map(np.asarray, self.collate_fn(samples))]
+        self.ring = SlotRing(self.num_slots, len(indices), fields)
+
+    def __iter__(self):
+        # the slots and the workers are created on the calling thread, the
+        # returned generator only consumes the batches, so it may be
+        # iterated by the background thread of DevicePrefetcher
+        batches = iter(self.batch_sampler)
+        first = next(batches, None)
+        if first is None:
+            return iter([])
+        if self.ring is None:
+            self._create_ring(first)
+        batches = itertools.chain([first], batches)
+
+        ctx = multiprocessing.get_context('fork')
+        task_queue = ctx.Queue()
+        ready_queue = ctx.Queue()
+        base_seed = np.random.randint(0, 2**31)
+        workers = [
+            ctx.Process(
+                target=_worker_loop,
+                args=(self.dataset, self.collate_fn, self.ring, task_queue,
+                      ready_queue, i, base_seed + i))
+            for i in range(self.num_workers)
+        ]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        return self._consume(batches, workers, task_queue, ready_queue)
+
+    def _consume(self, batches, workers, task_queue, ready_queue):
+        free_slots = list(range(self.num_slots))
+        ready = {}
+        sent = 0
+        batch_id = 0
+        try:
+            while True:
+                while free_slots:
+                    indices = next(batches, None)
+                    if indices is None:
+                        break
+                    task_queue.put((sent, free_slots.pop(), indices))
+                    sent += 1
+                if batch_id == sent:
+                    break
+                # reorder, batches may be finished out of order
+                while batch_id not in ready:
+                    try:
+                        done_id, slot, n, error = ready_queue.get(
+                            timeout=POLL_INTERVAL)
+                    except queue.Empty:
+                        _check_alive(workers)
+                        continue
+                    if error is not None:
+                        raise RuntimeError(
+                            "shared_memory loader worker failed:\n" + error)
+                    ready[done_id] = (slot, n)
+                slot, n = ready.pop(batch_id)
+                yield self.ring.views(slot, n)
+                free_slots.append(slot)
+                batch_id += 1
+        finally:
+            for _ in workers:
+                task_queue.put(None)
+            for w in workers:
+                w.join(timeout=5)
+                if w.is_alive():
+                    w.terminate()
+
+    def __call__(self):
+        return self.__iter__()
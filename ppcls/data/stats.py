@@ -0,0 +1,91 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from paddle.io import get_worker_info
+
+__all__ = ['WorkerStats', 'set_worker_id', 'get_worker_id']
+
+# id of the current worker of the loaders of ppcls, which are unknown to
+# get_worker_info. Thread local, a forked worker keeps the value of the
+# thread which forked it
+_worker = threading.local()
+
+
+def set_worker_id(worker_id):
+    """ set the id of the worker process or thread running this function """
+    _worker.id = worker_id
+
+
+def get_worker_id():
+    """ id set by set_worker_id in this process or thread, or None """
+    return getattr(_worker, 'id', None)
+
+
+class WorkerStats(object):
+    """
+    float64 counters shared between the main process and the dataloader
+    worker processes. Every process owns one row, so updating a counter
+    needs no lock. Row 0 belongs to the main process, workers of
+    paddle.io.DataLoader are found by get_worker_info, workers of the
+    loaders of ppcls call set_worker_id.
+
+    Args:
+        fields(list): names of the counters
+        num_workers(int): number of worker processes
+    """
+
+    def __init__(self, fields, num_workers=0):
+        self.fields = list(fields)
+        self.num_rows = num_workers + 1
+        # RawArray is created before the workers fork, so they share it
+        self._data = multiprocessing.RawArray(
+            'd', self.num_rows * len(self.fields))
+
+    @property
+    def rows(self):
+        """ counters of all processes, in shape [num_workers + 1, fields] """
+        return np.frombuffer(
+            self._data, dtype='float64').reshape(self.num_rows, -1)
+
+    def _row(self):
+        worker_id = get_worker_id()
+        if worker_id is None:
+            info = get_worker_info()
+            worker_id = None if info is None else info.id
+        row = 0 if worker_id is None else worker_id + 1
+        return self.rows[row % self.num_rows]
+
+    def add(self, field, value=1):
+        """ add value to a counter of the current process """
+        self._row()[self.fields.index(field)] += value
+
+    def add_at(self, indices, values):
+        """ add values to the counters at indices of the current process """
+        self._row()[indices] += values
+
+    def totals(self):
+        """ counters summed over all processes """
+        return OrderedDict(zip(self.fields, self.rows.sum(axis=0).tolist()))
+
+    def reset(self):
+        self.rows[...] = 0
@@ -0,0 +1,153 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import paddle
+
+from .stats import get_worker_id
+from .stats import set_worker_id
+
+__all__ = ['ThreadLoader']
+
+
+class ThreadLoader(object):
+    """
+    Load batches with a pool of threads in the main process.
+
+    Decoding and the cv2 ops release the GIL, so threads run them in
+    parallel without copying the dataset into worker processes or pickling
+    the batches. Without collate_fn, every sample is written by its thread
+    into a preallocated batch buffer. There is one buffer for every batch
+    in flight, they are reused round-robin. The buffers are sized by the
+    first loaded batch, which is stacked instead.
+
+    Every thread has its own id, and so its own row of the WorkerStats
+    counters of the dataset.
+
+    Args:
+        dataset(Dataset): dataset returning (img, label)
+        batch_sampler(BatchSampler): sampler of the indices of the batches
+        collate_fn(callable): function to merge a list of samples, if None
+            samples are stacked into the batch buffers
+        num_threads(int): number of loading threads
+        prefetch(int): number of batches loaded ahead
+        places(Place|list): place of the output tensors
+    """
+
+    def __init__(self,
+                 dataset,
+                 batch_sampler,
+                 collate_fn=None,
+                 num_threads=8,
+                 prefetch=2,
+                 places=None):
+        assert num_threads > 0, "num_threads should > 0"
+        assert prefetch > 0, "prefetch should > 0"
+        self.dataset = dataset
+        self.batch_sampler = batch_sampler
+        self.collate_fn = collate_fn
+        self.num_threads = num_threads
+        self.prefetch = prefetch
+        if isinstance(places, (list, tuple)):
+            places = places[0] if places else None
+        self.place = places
+        self.buffers = None
+        self._thread_ids = None
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def reset(self):
+        """ drop the buffers, when the shape of the samples changes """
+        self.buffers = None
+
+    def _alloc_buffers(self, sample, batch_size):
+        img = np.asarray(sample[0])
+        self.buffers = [(np.empty(
+            (batch_size, ) + img.shape, dtype=img.dtype), np.empty(
+                (batch_size, ), dtype='int64'))
+                        for _ in range(self.prefetch + 1)]
+
+    def _load(self, idx):
+        if get_worker_id() is None:
+            # the threads of a pool are new, ids count from 0 for every pool
+            set_worker_id(next(self._thread_ids))
+        return self.dataset[idx]
+
+    def _fill(self, buf, k, idx):
+        img, label = self._load(idx)
+        imgs, labels = buf
+        assert img.shape == imgs.shape[1:], \
+            "samples in a batch should have the same shape, " \
+            "expect {} but got {}".format(imgs.shape[1:], img.shape)
+        imgs[k] = img
+        labels[k] = label
+
+    def _submit(self, pool, indices, batch_id):
+        """ submit the samples of a batch, return (buffer, futures) """
+        if self.buffers is not None and \
+                len(indices) > len(self.buffers[0][1]):
+            self.buffers = None
+        if self.collate_fn is not None or self.buffers is None:
+            return None, [pool.submit(self._load, idx) for idx in indices]
+        buf = self.buffers[batch_id % len(self.buffers)]
+        return buf, [
+            pool.submit(self._fill, buf, k, idx)
+            for k, idx in enumerate(indices)
+        ]
+
+    def _to_tensors(self, fields):
+        return [paddle.to_tensor(field, place=self.place) for field in fields]
+
+    def _batch(self, buf, futures):
+        samples = [f.result() for f in futures]
+        if self.collate_fn is not None:
+            return self._to_tensors(self.collate_fn(samples))
+        if buf is None:
+            if self.buffers is None:
+                self._alloc_buffers(samples[0], len(samples))
+            imgs, labels = list(zip(*samples))
+            return self._to_tensors(
+                [np.stack(imgs), np.array(labels, dtype='int64')])
+        imgs, labels = buf
+        # to_tensor copies, so the buffer can be refilled afterwards
+        return self._to_tensors([imgs[:len(futures)], labels[:len(futures)]])
+
+    def __iter__(self):
+        pool = ThreadPoolExecutor(self.num_threads)
+        self._thread_ids = itertools.count()
+        pending = deque()
+        try:
+            for batch_id, indices in enumerate(self.batch_sampler):
+                pending.append(self._submit(pool, indices, batch_id))
+                if len(pending) > self.prefetch:
+                    yield self._batch(*pending.popleft())
+            while pending:
+                yield self._batch(*pending.popleft())
+        finally:
+            for _, futures in pending:
+                for f in futures:
+                    f.cancel()
+            pool.shutdown(wait=True)
+
+    def __call__(self):
+        return self.__iter__()
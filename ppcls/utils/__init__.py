@@ -19,3 +19,5 @@ from . import model_zoo
 from .save_load import init_model, save_model
 from .config import get_config
 from .misc import AverageMeter
+from .misc import TensorAccumulator
+from .strategy import create_strategy
@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-__all__ = ['AverageMeter']
+from collections import OrderedDict
+
+import paddle
+
+__all__ = ['AverageMeter', 'TensorAccumulator']
 
 
 class AverageMeter(object):
@@ -41,6 +45,13 @@ class AverageMeter(object):
         self.count += n
         self.avg = self.sum / self.count
 
+    def merge(self, total, n, val):
+        """ merge the sum of n values, val is the last one """
+        self.val = val
+        self.sum += total
+        self.count += n
+        self.avg = self.sum / self.count
+
     @property
     def total(self):
         return '{self.name}_sum: {self.sum:{self.fmt}}{self.postfix}'.format(
@@ -60,3 +71,44 @@ class AverageMeter(object):
     def value(self):
         return '{self.name}: {self.val:{self.fmt}}{self.postfix}'.format(
             self=self)
+
+
+class TensorAccumulator(object):
+    """
+    Running sums of scalar tensors, kept on their device so that adding a
+    value does not wait for the device. They are copied to the host only
+    by flush, which merges them into AverageMeters.
+    """
+
+    def __init__(self):
+        self.sums = OrderedDict()
+        self.lasts = OrderedDict()
+        self.counts = OrderedDict()
+
+    def add(self, name, val, n=1):
+        """ add a scalar tensor val, weighted by n """
+        val = val.detach().reshape([1])
+        weighted = val * n
+        if name in self.sums:
+            self.sums[name] = self.sums[name] + weighted
+            self.counts[name] += n
+        else:
+            self.sums[name] = weighted
+            self.counts[name] = n
+        self.lasts[name] = val
+
+    def flush(self, meters):
+        """ merge the sums into meters, a dict of AverageMeter, by name """
+        if not self.sums:
+            return
+        names = list(self.sums)
+        # one copy to the host for all the sums
+        values = paddle.concat([self.sums[name] for name in names] +
+                               [self.lasts[name] for name in names]).numpy()
+        for i, name in enumerate(names):
+            meters[name].merge(
+                float(values[i]), self.counts[name],
+                float(values[len(names) + i]))
+        self.sums.clear()
+        self.lasts.clear()
+        self.counts.clear()
@@ -102,7 +102,8 @@ def load_distillation_model(model, pretrained_model, load_static_weights):
 
 def init_model(config, net, optimizer=None):
     """
-    load model from checkpoint or pretrained_model
+    load model from checkpoint or pretrained_model,
+    return the training states saved with the checkpoint if there are
     """
     checkpoints = config.get('checkpoints')
     if checkpoints:
@@ -115,6 +116,8 @@ def init_model(config, net, optimizer=None):
         net.set_dict(para_dict)
         optimizer.set_state_dict(opti_dict)
         logger.info("Finish initing model from {}".format(checkpoints))
+        if os.path.exists(checkpoints + ".pdstates"):
+            return paddle.load(checkpoints + ".pdstates")
         return
 
     pretrained_model = config.get('pretrained_model')
@@ -146,9 +149,14 @@ def _save_student_model(net, model_prefix):
             student_model_prefix))
 
 
-def save_model(net, optimizer, model_path, epoch_id, prefix='ppcls'):
+def save_model(net,
+               optimizer,
+               model_path,
+               epoch_id,
+               prefix='ppcls',
+               states=None):
     """
-    save model to the target path
+    save model to the target path, and the training states(dict) if given
     """
     if paddle.distributed.get_rank() != 0:
         return
@@ -160,4 +168,6 @@ def save_model(net, optimizer, model_path, epoch_id, prefix='ppcls'):
 
     paddle.save(net.state_dict(), model_prefix + ".pdparams")
     paddle.save(optimizer.state_dict(), model_prefix + ".pdopt")
+    if states is not None:
+        paddle.save(states, model_prefix + ".pdstates")
     logger.info("Already save model in {}".format(model_path))
@@ -0,0 +1,218 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmark the data pipeline of a config without the model, e.g.
+
+    python tools/benchmark/benchmark_data.py \
+        -c configs/ResNet/ResNet50.yaml \
+        --num_workers 2,4,8 --batch_sizes 64,256 --num_batches 100
+
+For every combination of num_workers and batch_size it reports the
+throughput, the percentiles of the time waiting for a batch, the cpu
+utilization of every worker process and their memory (PSS on linux).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(__dir__)
+sys.path.append(os.path.abspath(os.path.join(__dir__, '../..')))
+
+import numpy as np
+import paddle
+
+from ppcls.data import Reader
+from ppcls.utils.config import get_config
+from ppcls.utils import logger
+
+
+def parse_args():
+    def int_list(v):
+        return [int(x) for x in v.split(',') if x]
+
+    parser = argparse.ArgumentParser("PaddleClas data benchmark script")
+    parser.add_argument(
+        '-c',
+        '--config',
+        type=str,
+        default='configs/ResNet/ResNet50.yaml',
+        help='config file path')
+    parser.add_argument(
+        '-m',
+        '--mode',
+        type=str,
+        default='train',
+        help='which reader of the config to benchmark, train or valid')
+    parser.add_argument(
+        '--num_workers',
+        type=int_list,
+        default=None,
+        help='comma separated num_workers to sweep, default is the config')
+    parser.add_argument(
+        '--batch_sizes',
+        type=int_list,
+        default=None,
+        help='comma separated batch sizes to sweep, default is the config')
+    parser.add_argument(
+        '--num_batches',
+        type=int,
+        default=100,
+        help='batches measured for every combination')
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=10,
+        help='batches skipped before measuring')
+    parser.add_argument(
+        '-o',
+        '--override',
+        action='append',
+        default=[],
+        help='config options to be overridden')
+    args = parser.parse_args()
+    return args
+
+
+def _child_pids(pid):
+    """ pids of the child processes of pid, like the dataloader workers """
+    children = []
+    for task in os.listdir('/proc/{}/task'.format(pid)):
+        path = '/proc/{}/task/{}/children'.format(pid, task)
+        try:
+            with open(path) as f:
+                children.extend(int(p) for p in f.read().split())
+        except (IOError, OSError):
+            pass
+    return sorted(set(children))
+
+
+def _cpu_time(pid):
+    """ user + system cpu seconds of a process, None if it has exited """
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # the command may contain spaces, fields after it are fixed
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, OSError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _memory_mb(pid):
+    """ PSS of a process in MB, RSS if smaps_rollup is not supported """
+    for path, key in [('/proc/{}/smaps_rollup', 'Pss:'),
+                      ('/proc/{}/status', 'VmRSS:')]:
+        try:
+            with open(path.format(pid)) as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1]) / 1024.
+        except (IOError, OSError):
+            pass
+    return float('nan')
+
+
+def benchmark(config, mode, num_workers, batch_size, num_batches, warmup):
+    params = config[mode.upper()]
+    params['num_workers'] = num_workers
+    params['batch_size'] = batch_size
+    loader = Reader(config, mode, places=paddle.CPUPlace())()
+
+    waits = []
+    num_images = 0
+    batches = iter(loader())
+    tic = time.time()
+    for idx in range(warmup + num_batches):
+        batch = next(batches, None)
+        toc = time.time()
+        if batch is None:
+            break
+        if idx == warmup:
+            # workers are forked by now
+            main_pid = os.getpid()
+            pids = _child_pids(main_pid) or [main_pid]
+            cpu_start = [_cpu_time(pid) for pid in pids]
+            start = toc
+        elif idx > warmup:
+            waits.append(toc - tic)
+            image = batch['image'] if isinstance(batch, dict) else batch[0]
+            num_images += image.shape[0]
+        tic = time.time()
+    if not waits:
+        logger.warning("not enough batches to measure, num_workers: {}, "
+                       "batch_size: {}".format(num_workers, batch_size))
+        return None
+
+    elapsed = time.time() - start
+    utils = []
+    for pid, cpu in zip(pids, cpu_start):
+        cpu_end = _cpu_time(pid)
+        if cpu is not None and cpu_end is not None:
+            utils.append((cpu_end - cpu) / elapsed)
+    memory = [_memory_mb(pid) for pid in pids]
+    main_memory = _memory_mb(os.getpid())
+    del batches
+
+    waits = np.array(waits) * 1000
+    return {
+        'num_workers': num_workers,
+        'batch_size': batch_size,
+        'ips': num_images / elapsed,
+        'p50': np.percentile(waits, 50),
+        'p90': np.percentile(waits, 90),
+        'p99': np.percentile(waits, 99),
+        'util_mean': np.mean(utils) * 100 if utils else float('nan'),
+        'util_max': np.max(utils) * 100 if utils else float('nan'),
+        'cpus': np.sum(utils) if utils else float('nan'),
+        'worker_mb': np.nanmean(memory),
+        'main_mb': main_memory,
+    }
+
+
+def main(args):
+    config = get_config(args.config, overrides=args.override, show=False)
+    params = config[args.mode.upper()]
+    num_workers_list = args.num_workers or [params['num_workers']]
+    batch_sizes = args.batch_sizes or [params['batch_size']]
+
+    header = "{:>8s} {:>8s} {:>10s} {:>9s} {:>9s} {:>9s} {:>8s} {:>8s} " \
+        "{:>6s} {:>11s} {:>9s}".format(
+            'workers', 'batch', 'images/s', 'p50(ms)', 'p90(ms)', 'p99(ms)',
+            'util', 'max_util', 'cpus', 'worker(MB)', 'main(MB)')
+    rows = []
+    for batch_size in batch_sizes:
+        for num_workers in num_workers_list:
+            result = benchmark(config, args.mode, num_workers, batch_size,
+                               args.num_batches, args.warmup)
+            if result is None:
+                continue
+            rows.append(
+                "{num_workers:>8d} {batch_size:>8d} {ips:>10.1f} {p50:>9.2f} "
+                "{p90:>9.2f} {p99:>9.2f} {util_mean:>7.1f}% {util_max:>7.1f}% "
+                "{cpus:>6.2f} {worker_mb:>11.1f} {main_mb:>9.1f}".format(
+                    **result))
+            logger.info("{}\n{}".format(header, rows[-1]))
+    logger.info("data benchmark of {} in {} mode, {} batches each:\n{}\n{}".
+                format(args.config, args.mode, args.num_batches, header,
+                       '\n'.join(rows)))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,85 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(__dir__)
+sys.path.append(os.path.abspath(os.path.join(__dir__, '..')))
+
+from ppcls.data.reader import DATASET_FORMATS
+from ppcls.data.bad_sample import check_samples
+from ppcls.data.bad_sample import save_blacklist
+from ppcls.utils.config import get_config
+from ppcls.utils import logger
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("PaddleClas check data script")
+    parser.add_argument(
+        '-c',
+        '--config',
+        type=str,
+        default='configs/ResNet/ResNet50.yaml',
+        help='config file path')
+    parser.add_argument(
+        '-m',
+        '--mode',
+        type=str,
+        default='train',
+        help='which dataset of the config to check, train or valid')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='blacklist.txt',
+        help='path to save the blacklist')
+    parser.add_argument(
+        '--num_threads',
+        type=int,
+        default=16,
+        help='threads used to read and decode the images')
+    parser.add_argument(
+        '-o',
+        '--override',
+        action='append',
+        default=[],
+        help='config options to be overridden')
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    config = get_config(args.config, overrides=args.override, show=False)
+    params = dict(config[args.mode.upper()])
+    # the blacklist records indices of the unshuffled dataset
+    params['mode'] = 'valid'
+    params.pop('cache_dir', None)
+    params.pop('blacklist', None)
+    dataset = DATASET_FORMATS[params.get('format', 'common')](params)
+
+    bad = check_samples(dataset, args.num_threads)
+    save_blacklist(args.output, bad)
+    logger.info("{} of {} samples are bad, blacklist is saved to {}, set "
+                "{}.blacklist to use it".format(
+                    len(bad), len(dataset), args.output, args.mode.upper()))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
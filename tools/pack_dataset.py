@@ -0,0 +1,85 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(__dir__, '..')))
+
+from ppcls.data.packed import PackedWriter
+from ppcls.utils import logger
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("PaddleClas pack dataset script")
+    parser.add_argument(
+        '-f', '--file_list', type=str, required=True, help='file list path')
+    parser.add_argument(
+        '-d', '--data_dir', type=str, required=True, help='image root dir')
+    parser.add_argument(
+        '-o',
+        '--output_dir',
+        type=str,
+        required=True,
+        help='dir to save the shards and the index file')
+    parser.add_argument(
+        '-n',
+        '--name',
+        type=str,
+        default=None,
+        help='name of the packed dataset, default is the file list name')
+    parser.add_argument(
+        '--shard_size', type=int, default=1024, help='shard size in MB')
+    parser.add_argument('--delimiter', type=str, default=' ')
+    parser.add_argument(
+        '--num_threads',
+        type=int,
+        default=16,
+        help='threads used to read the images')
+    return parser.parse_args()
+
+
+def main(args):
+    name = args.name or os.path.splitext(os.path.basename(args.file_list))[0]
+    with open(args.file_list) as flist:
+        lines = [line.strip() for line in flist if line.strip()]
+
+    def read(line):
+        img_path, label = line.split(args.delimiter)
+        with open(os.path.join(args.data_dir, img_path), 'rb') as f:
+            return f.read(), int(label)
+
+    writer = PackedWriter(args.output_dir, name, args.shard_size << 20)
+    chunk = args.num_threads * 64
+    with ThreadPoolExecutor(args.num_threads) as pool:
+        for start in range(0, len(lines), chunk):
+            # map keeps the order of the file list
+            for img, label in pool.map(read, lines[start:start + chunk]):
+                writer.write(img, label)
+            logger.info("packed {}/{} images".format(
+                min(start + chunk, len(lines)), len(lines)))
+    index_path = writer.close()
+    logger.info("packed {} images into {} shards, index file: {}".format(
+        len(lines), writer.shard_id + 1, index_path))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
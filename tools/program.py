@@ -16,10 +16,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
+import inspect
 import os
 import time
 from collections import OrderedDict
 
+import numpy as np
 import paddle
 from paddle import to_tensor
 import paddle.nn as nn
@@ -33,6 +36,9 @@ from ppcls.modeling.loss import MixCELoss
 from ppcls.modeling.loss import JSDivLoss
 from ppcls.modeling.loss import GoogLeNetLoss
 from ppcls.utils.misc import AverageMeter
+from ppcls.utils.misc import TensorAccumulator
+from ppcls.utils.save_load import save_model
+from ppcls.utils.strategy import create_strategy
 from ppcls.utils import logger
 
 
@@ -54,6 +60,68 @@ def create_model(architecture, classes_num):
     return architectures.__dict__[name](class_dim=classes_num, **params)
 
 
+def _static_forward(layer, build_strategy):
+    """ forward of layer converted by paddle.jit.to_static """
+    eager_forward = layer.forward
+    if build_strategy is None:
+        paddle.jit.to_static(layer)
+    else:
+        paddle.jit.to_static(layer, build_strategy=build_strategy)
+    static_forward = layer.forward
+    layer.forward = eager_forward
+    return static_forward
+
+
+def _convert_layer(layer, build_strategy, name):
+    eager_forward = layer.forward
+    static_forward = _static_forward(layer, build_strategy)
+
+    def forward(*args, **kwargs):
+        # only the conversion falls back to eager, the errors of running
+        # the program, like out of memory, are raised
+        try:
+            static_forward.get_concrete_program(*args, **kwargs)
+        except Exception as e:
+            logger.warning("failed to convert {} to static, run it eagerly: "
+                           "{}".format(name, e))
+            layer.forward = eager_forward
+            for sub_name, sublayer in layer.named_children():
+                _convert_layer(sublayer, build_strategy,
+                               "{}.{}".format(name, sub_name))
+            return layer.forward(*args, **kwargs)
+        layer.forward = static_forward
+        return static_forward(*args, **kwargs)
+
+    layer.forward = forward
+
+
+def convert_to_static(net, config):
+    """
+    Convert the forward of net to a static graph for training, with the
+    build strategy of the static mode, see ppcls.utils.strategy, if
+    paddle.jit.to_static supports it (paddle 2.1 or higher). The graph
+    is built by the first forward, if it fails the layer runs eagerly and
+    each of its sublayers is converted instead. The loss stays eager.
+
+    Args:
+        net(paddle.nn.Layer): model created by create_model
+        config(dict): config, for the fusion strategies
+
+    Returns:
+        net, converted in place
+    """
+    build_strategy, _ = create_strategy(config)
+    if 'build_strategy' not in inspect.signature(
+            paddle.jit.to_static).parameters:
+        logger.warning(
+            "paddle.jit.to_static of paddle {} has no build_strategy, the "
+            "model is converted without the fusion strategies of the "
+            "static mode".format(paddle.__version__))
+        build_strategy = None
+    _convert_layer(net, build_strategy, type(net).__name__)
+    return net
+
+
 def create_loss(feeds,
                 out,
                 architecture,
@@ -224,12 +292,14 @@ def create_optimizer(config, parameter_list=None):
     Returns:
         an optimizer instance
     """
-    # create learning_rate instance
+    # create learning_rate instance, the schedule counts the optimizer steps
+    # of the effective batch, batch_size * grad_accum_steps
     lr_config = config['LEARNING_RATE']
+    effective_batch_size = config['TRAIN']['batch_size'] * config.get(
+        'grad_accum_steps', 1)
     lr_config['params'].update({
         'epochs': config['epochs'],
-        'step_each_epoch':
-        config['total_images'] // config['TRAIN']['batch_size'],
+        'step_each_epoch': config['total_images'] // effective_batch_size,
     })
     lr = LearningRateBuilder(**lr_config)()
 
@@ -239,15 +309,59 @@ def create_optimizer(config, parameter_list=None):
     return opt(lr, parameter_list), lr
 
 
+def create_scaler(config):
+    """
+    Create the loss scaler of the auto mixed precision training, with the
+    same config as the static mode: use_amp, scale_loss and
+    use_dynamic_loss_scaling.
+
+    Returns:
+        a paddle.amp.GradScaler, None if use_amp is not set
+    """
+    use_amp = config.get('use_amp', False)
+    if config.get('use_pure_fp16', False):
+        logger.warning("use_pure_fp16 is not supported in dygraph mode, "
+                       "use_amp is used instead")
+        use_amp = True
+    if not use_amp:
+        return None
+    return paddle.amp.GradScaler(
+        init_loss_scaling=config.get('scale_loss', 1.0),
+        use_dynamic_loss_scaling=config.get('use_dynamic_loss_scaling',
+                                            False))
+
+
+@contextlib.contextmanager
+def _no_sync(net, skip):
+    """ skip the gradient all-reduce of a DataParallel net if skip is set """
+    if skip and hasattr(net, 'no_sync'):
+        with net.no_sync():
+            yield
+    else:
+        yield
+
+
+def _column(field, dtype):
+    """ field as a column tensor, numpy fields are not copied on host """
+    if not isinstance(field, np.ndarray):
+        field = field.numpy()
+    return to_tensor(field.astype(dtype, copy=False).reshape(-1, 1))
+
+
 def create_feeds(batch, use_mix):
+    if isinstance(batch, dict):
+        # feeds staged by the device_prefetch of the reader
+        return batch
     image = batch[0]
+    if isinstance(image, np.ndarray):
+        image = to_tensor(image)
     if use_mix:
-        y_a = to_tensor(batch[1].numpy().astype("int64").reshape(-1, 1))
-        y_b = to_tensor(batch[2].numpy().astype("int64").reshape(-1, 1))
-        lam = to_tensor(batch[3].numpy().astype("float32").reshape(-1, 1))
+        y_a = _column(batch[1], "int64")
+        y_b = _column(batch[2], "int64")
+        lam = _column(batch[3], "float32")
         feeds = {"image": image, "y_a": y_a, "y_b": y_b, "lam": lam}
     else:
-        label = to_tensor(batch[1].numpy().astype('int64').reshape(-1, 1))
+        label = _column(batch[1], "int64")
         feeds = {"image": image, "label": label}
     return feeds
 
@@ -258,7 +372,8 @@ def run(dataloader,
         optimizer=None,
         lr_scheduler=None,
         epoch=0,
-        mode='train'):
+        mode='train',
+        scaler=None):
     """
     Feed data to the model and fetch the measures and loss
 
@@ -269,11 +384,16 @@ def run(dataloader,
         fetchs(dict): dict of measures and the loss
         epoch(int): epoch of training or validation
         model(str): log only
+        scaler(paddle.amp.GradScaler): train with auto mixed precision
+            if not None, see create_scaler
 
     Returns:
     """
     print_interval = config.get("print_interval", 10)
     use_mix = config.get("use_mix", False) and mode == "train"
+    # batches whose gradients are accumulated for one optimizer step
+    accum_steps = config.get("grad_accum_steps", 1) if mode == "train" else 1
+    assert accum_steps >= 1, "grad_accum_steps should >= 1"
 
     metric_list = [
         ("loss", AverageMeter(
@@ -294,8 +414,52 @@ def run(dataloader,
             0, ("top1", AverageMeter(
                 "top1", '.5f', postfix=",")))
 
-    metric_list = OrderedDict(metric_list)
+    use_amp = scaler is not None and mode == 'train'
+    if use_amp:
+        metric_list.extend([
+            ("loss_scale", AverageMeter(
+                'loss_scale', '.1f', postfix=",", need_avg=False)),
+            ("overflow", AverageMeter(
+                'overflow', '.0f', postfix=",", need_avg=False)),
+        ])
+        amp_lists = {
+            'custom_white_list': config.get('amp_custom_white_list'),
+            'custom_black_list': config.get('amp_custom_black_list'),
+        }
+        # overflows logged so far
+        logged_overflows = 0
 
+    metric_list = OrderedDict(metric_list)
+    # loss and accuracies stay on the device until they are logged
+    accumulator = TensorAccumulator()
+
+    # counters of unreadable samples replaced by the dataset
+    bad_samples = getattr(
+        getattr(dataloader, 'dataset', None), 'bad_samples', None)
+
+    # time of the transforms, if profile_interval of the reader is set
+    op_profiler = getattr(
+        getattr(dataloader, 'dataset', None), 'op_profiler', None)
+    if op_profiler is not None:
+        op_profiler.reset()
+
+    # a resumable sampler may start the epoch at a later step
+    batch_sampler = getattr(dataloader, 'batch_sampler', None)
+    step_offset = getattr(batch_sampler, 'start_step', 0)
+    # the lr schedule counts steps of TRAIN.batch_size * grad_accum_steps,
+    # the batch size of a progressive resizing stage may differ
+    lr_step_scale = 1. / accum_steps
+    if mode == 'train' and getattr(batch_sampler, 'batch_size', None):
+        base_batch_size = config['TRAIN'][
+            'batch_size'] // paddle.distributed.get_world_size()
+        lr_step_scale *= float(batch_sampler.batch_size) / base_batch_size
+    save_step_interval = config.get("save_step_interval", 0) \
+        if mode == 'train' else 0
+    # a checkpoint in the middle of an accumulation loses its gradients
+    assert save_step_interval % accum_steps == 0, \
+        "save_step_interval should be a multiple of grad_accum_steps"
+
+    step = step_offset
     tic = time.time()
     for idx, batch in enumerate(dataloader()):
         # avoid statistics from warmup time
@@ -304,41 +468,90 @@ def run(dataloader,
             metric_list["reader_time"].reset()
 
         metric_list['reader_time'].update(time.time() - tic)
-        batch_size = len(batch[0])
         feeds = create_feeds(batch, use_mix)
-        fetchs = create_fetchs(feeds, net, config, mode)
+        batch_size = feeds['image'].shape[0]
+        step = step_offset + idx + 1
+        # the optimizer steps at the last batch of every accumulation
+        update_params = step % accum_steps == 0
+        if use_amp:
+            with paddle.amp.auto_cast(**amp_lists):
+                fetchs = create_fetchs(feeds, net, config, mode)
+        else:
+            fetchs = create_fetchs(feeds, net, config, mode)
         if mode == 'train':
             avg_loss = fetchs['loss']
-            avg_loss.backward()
-
-            optimizer.step()
-            optimizer.clear_grad()
-            metric_list['lr'].update(
-                optimizer._global_learning_rate().numpy()[0], batch_size)
+            if accum_steps > 1:
+                avg_loss = avg_loss / accum_steps
+            if use_amp:
+                avg_loss = scaler.scale(avg_loss)
+            # gradients are all-reduced only with the optimizer step
+            with _no_sync(net, not update_params):
+                avg_loss.backward()
+            if update_params:
+                if use_amp:
+                    # skips the update if the gradients overflow, and
+                    # adjusts the scale with use_dynamic_loss_scaling
+                    scaler.minimize(optimizer, avg_loss)
+                    accumulator.add('loss_scale', scaler._scale)
+                    accumulator.add('overflow',
+                                    paddle.cast(scaler._found_inf,
+                                                'float32'))
+                else:
+                    optimizer.step()
+                optimizer.clear_grad()
+            # get_lr is a python float, reading it does not sync the device
+            metric_list['lr'].update(optimizer.get_lr(), batch_size)
 
             if lr_scheduler is not None:
-                if lr_scheduler.update_specified:
-                    curr_global_counter = lr_scheduler.step_each_epoch * epoch + idx
-                    update = max(
-                        0, curr_global_counter - lr_scheduler.update_start_step
-                    ) % lr_scheduler.update_step_interval == 0
-                    if update:
+                # steps of the schedule taken by this batch
+                first = int((step_offset + idx) * lr_step_scale + 1e-6)
+                last = int((step_offset + idx + 1) * lr_step_scale + 1e-6)
+                for lr_step in range(first, last):
+                    if lr_scheduler.update_specified:
+                        curr_global_counter = lr_scheduler.step_each_epoch * epoch + lr_step
+                        update = max(
+                            0,
+                            curr_global_counter - lr_scheduler.update_start_step
+                        ) % lr_scheduler.update_step_interval == 0
+                        if update:
+                            lr_scheduler.step()
+                    else:
                         lr_scheduler.step()
-                else:
-                    lr_scheduler.step()
+
+            if save_step_interval and step % save_step_interval == 0:
+                model_path = os.path.join(config.model_save_dir,
+                                          config.ARCHITECTURE["name"])
+                save_model(
+                    net,
+                    optimizer,
+                    model_path,
+                    "latest",
+                    states={'epoch': epoch,
+                            'step': step})
 
         for name, fetch in fetchs.items():
-            metric_list[name].update(fetch.numpy()[0], batch_size)
+            accumulator.add(name, fetch, batch_size)
         metric_list["batch_time"].update(time.time() - tic)
         tic = time.time()
 
-        fetchs_str = ' '.join([
-            str(metric_list[key].mean)
-            if "time" in key else str(metric_list[key].value)
-            for key in metric_list
-        ])
-
         if idx % print_interval == 0:
+            accumulator.flush(metric_list)
+            fetchs_str = ' '.join([
+                str(metric_list[key].mean) if "time" in key else
+                str(metric_list[key].total)
+                if key == "overflow" else str(metric_list[key].value)
+                for key in metric_list
+            ])
+            if use_amp and metric_list['overflow'].sum > logged_overflows:
+                logger.warning(
+                    "{:d} steps skipped by fp16 gradient overflow since the "
+                    "last log, loss scale is {:.1f} now".format(
+                        int(metric_list['overflow'].sum - logged_overflows),
+                        metric_list['loss_scale'].val))
+                logged_overflows = metric_list['overflow'].sum
+            data_info = bad_samples.summary() if bad_samples else ''
+            if data_info:
+                fetchs_str += ' ' + data_info
             ips_info = "ips: {:.5f} images/sec.".format(
                 batch_size / metric_list["batch_time"].avg)
             if mode == 'eval':
@@ -354,8 +567,22 @@ def run(dataloader,
                     logger.coloring(fetchs_str, 'OKGREEN'),
                     logger.coloring(ips_info, 'OKGREEN')))
 
+        if op_profiler is not None and idx > 0 and \
+                idx % op_profiler.interval == 0:
+            logger.info("{:s} transforms since the last table, reader_cost: "
+                        "{:.5f} s\n{:s}".format(mode, metric_list[
+                            "reader_time"].avg, op_profiler.table()))
+            op_profiler.reset()
+
+    if accum_steps > 1 and step % accum_steps != 0:
+        # gradients of an incomplete accumulation at the end of the epoch
+        optimizer.clear_grad()
+
+    accumulator.flush(metric_list)
     end_str = ' '.join([str(m.mean) for m in metric_list.values()] +
                        [metric_list['batch_time'].total])
+    if use_amp:
+        end_str += ' ' + metric_list['overflow'].total
     ips_info = "ips: {:.5f} images/sec.".format(
         batch_size * metric_list["batch_time"].count /
         metric_list["batch_time"].sum)
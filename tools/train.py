@@ -50,6 +50,26 @@ def parse_args():
     return args
 
 
+def set_resize_stage(dataloader, epoch, stage=None):
+    """
+    Set the batch size of the progressive resizing stage of epoch, the crop
+    size is set by the dataset with its epoch. Return the stage.
+    """
+    schedule = getattr(dataloader.dataset, 'resize_schedule', None)
+    new_stage = schedule.stage(epoch) if schedule is not None else None
+    if new_stage is None or new_stage == stage:
+        return stage
+    size, batch_size = new_stage
+    dataloader.batch_sampler.batch_size = \
+        batch_size // paddle.distributed.get_world_size()
+    # batch buffers of the thread and shared_memory loaders
+    if hasattr(dataloader, 'reset'):
+        dataloader.reset()
+    logger.info("progressive resizing, epoch {}: size {}, batch_size {}".
+                format(epoch, size, batch_size))
+    return new_stage
+
+
 def main(args):
     paddle.seed(12345)
 
@@ -57,6 +77,13 @@ def main(args):
     # assign the place
     use_gpu = config.get("use_gpu", True)
     place = paddle.set_device('gpu' if use_gpu else 'cpu')
+    if config.get('use_amp', False) or config.get('use_pure_fp16', False):
+        os.environ['FLAGS_cudnn_batchnorm_spatial_persistent'] = '1'
+        paddle.fluid.set_flags({
+            'FLAGS_cudnn_exhaustive_search': 1,
+            'FLAGS_conv_workspace_size_limit': 4000,
+            'FLAGS_cudnn_batchnorm_spatial_persistent': 1,
+        })
 
     trainer_num = paddle.distributed.get_world_size()
     use_data_parallel = trainer_num != 1
@@ -66,28 +93,60 @@ def main(args):
         paddle.distributed.init_parallel_env()
 
     net = program.create_model(config.ARCHITECTURE, config.classes_num)
+    if config.get("to_static", False):
+        net = program.convert_to_static(net, config)
     optimizer, lr_scheduler = program.create_optimizer(
         config, parameter_list=net.parameters())
+    # loss scaler of the auto mixed precision training, None if it is off
+    scaler = program.create_scaler(config)
 
     if config["use_data_parallel"]:
         net = paddle.DataParallel(net)
 
     # load model from checkpoint or pretrained model
-    init_model(config, net, optimizer)
+    states = init_model(config, net, optimizer)
 
     train_dataloader = Reader(config, 'train', places=place)()
+    batch_sampler = train_dataloader.batch_sampler
 
     if config.validate:
         valid_dataloader = Reader(config, 'valid', places=place)()
 
     last_epoch_id = config.get("last_epoch", -1)
+    start_step = 0
+    resize_stage = None
+    if states is not None:
+        # resume from the step saved with the checkpoint
+        last_epoch_id = states['epoch'] - 1
+        start_step = states['step']
+        resize_stage = set_resize_stage(train_dataloader, states['epoch'])
+        if start_step > 0 and not hasattr(batch_sampler, 'set_start_step'):
+            logger.warning(
+                "the checkpoint was saved at step {} of epoch {}, but the "
+                "batch sampler can not skip steps, set resumable: True in "
+                "TRAIN to resume from the step. The epoch is trained from "
+                "its first step".format(start_step, states['epoch']))
+            start_step = 0
+        if hasattr(batch_sampler, 'steps_per_epoch') and \
+                start_step >= batch_sampler.steps_per_epoch():
+            last_epoch_id, start_step = last_epoch_id + 1, 0
+        logger.info("Resume training from epoch {}, step {}".format(
+            last_epoch_id + 1, start_step))
     best_top1_acc = 0.0  # best top1 acc record
     best_top1_epoch = last_epoch_id
     for epoch_id in range(last_epoch_id + 1, config.epochs):
+        resize_stage = set_resize_stage(train_dataloader, epoch_id,
+                                        resize_stage)
+        if hasattr(batch_sampler, 'set_start_step'):
+            batch_sampler.set_epoch(epoch_id)
+            batch_sampler.set_start_step(start_step)
+        start_step = 0
+        # epoch of the ops scheduled by epoch, such as GridMask
+        train_dataloader.dataset.set_epoch(epoch_id)
         net.train()
         # 1. train with train dataset
         program.run(train_dataloader, config, net, optimizer, lr_scheduler,
-                    epoch_id, 'train')
+                    epoch_id, 'train', scaler)
 
         # 2. validate with validate dataset
         if config.validate and epoch_id % config.valid_interval == 0:
@@ -101,7 +160,13 @@ def main(args):
                 if epoch_id % config.save_interval == 0:
                     model_path = os.path.join(config.model_save_dir,
                                               config.ARCHITECTURE["name"])
-                    save_model(net, optimizer, model_path, "best_model")
+                    save_model(
+                        net,
+                        optimizer,
+                        model_path,
+                        "best_model",
+                        states={'epoch': epoch_id + 1,
+                                'step': 0})
             message = "The best top1 acc {:.5f}, in epoch: {:d}".format(
                 best_top1_acc, best_top1_epoch)
             logger.info("{:s}".format(logger.coloring(message, "RED")))
@@ -110,7 +175,13 @@ def main(args):
         if epoch_id % config.save_interval == 0:
             model_path = os.path.join(config.model_save_dir,
                                       config.ARCHITECTURE["name"])
-            save_model(net, optimizer, model_path, epoch_id)
+            save_model(
+                net,
+                optimizer,
+                model_path,
+                epoch_id,
+                states={'epoch': epoch_id + 1,
+                        'step': 0})
 
 
 if __name__ == '__main__':